@@ -1,16 +1,54 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import pandas as pd
-import faiss
-import pickle
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+import numpy as np
 import os
+import json
+import threading
 import traceback
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import torch
 import uvicorn
 
+from pagination import (
+    MAX_TOP_K,
+    CursorError,
+    collapse_duplicates,
+    decode_cursor,
+    encode_cursor,
+    ensure_depth,
+    group_of,
+    new_token,
+    query_key,
+    search_candidates,
+)
+from rerank import RERANK_DEPTH
+from lexical import hybrid_candidates, lexical_candidates
+from suggest import SUGGEST_LIMIT
+from facets import FACET_LIMIT, SEARCH_FACET_DEPTH
+from sharding import ShardedIndex, ShardUnavailableError
+from catalogs import DEFAULT_CATALOG, CatalogRegistry, load_catalog_configs
+from sessions import SESSION_HISTORY, make_session_store, recency_weights
+from singleflight import SingleFlight
+from http_cache import CompressionMiddleware, cached_response, make_etag
+from query_log import QUERY_LOG_PATH, QueryLogMiddleware, QueryLogWriter
+from profiling import PROFILE_MAX_SECONDS, ProfileMiddleware, artifact_path, current_profile, profile_window, torch_ops
+from warmup import WARMUP_GENERATE, Readiness, load_top_queries
+from memory import MemoryBudgetError, MemoryMonitor, model_nbytes
+from chat import (
+    CHAT_DEPTH,
+    CHAT_MAX_NEW_TOKENS,
+    EMBEDDING_CACHE_SIZE,
+    ConversationStore,
+    LRUCache,
+    apply_filters,
+    build_prompt,
+    rewrite_turn,
+)
+
 # Initialize FastAPI app
 app = FastAPI(title="AI Product Recommendation API")
 
@@ -21,28 +59,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Compress large JSON responses; /chat streams, so it is left alone
+app.add_middleware(CompressionMiddleware, skip_paths={"/chat"})
+
+def is_admin_token(token):
+    expected = os.environ.get("ADMIN_TOKEN")
+    return bool(expected) and token == expected
+
+# Per-request profiling for admins (X-Profile header); not installed at all without ADMIN_TOKEN
+if os.environ.get("ADMIN_TOKEN"):
+    app.add_middleware(ProfileMiddleware, is_admin=is_admin_token)
+
+# Opt-in sampled capture of request payloads for traffic replay (see replay.py)
+query_log_writer = QueryLogWriter(QUERY_LOG_PATH) if QUERY_LOG_PATH else None
+if query_log_writer:
+    app.add_middleware(QueryLogMiddleware, writer=query_log_writer)
+
 # Set working directory to project root
 os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 print("Current working directory:", os.getcwd())
 
 # Load data and models
 try:
-    # Load product dataset
-    df = pd.read_csv("data/cleaned_products.csv")
-    
-    # Add id column if it doesn't exist (use uniq_id as id)
-    if 'id' not in df.columns:
-        df['id'] = df['uniq_id']
-    
-    # Load FAISS index
-    index = faiss.read_index("models/faiss_index.bin")
-    
-    # Load metadata
-    with open("models/meta.pkl", "rb") as f:
-        meta = pickle.load(f)
-    
     # Embedding model
     embed_model = SentenceTransformer("all-MiniLM-L6-v2")
     
@@ -52,12 +93,39 @@ try:
         "cuda" if torch.cuda.is_available() else "cpu"
     )
     
-    # Load clustered data
-    clustered_df = pd.read_csv("data/clustered_products.csv")
+    # Per-component memory accounting; MEMORY_BUDGET_MB / CACHE_BUDGET_MB enforce budgets
+    memory_monitor = MemoryMonitor()
+    model_bytes = {"embed_model": model_nbytes(embed_model), "gen_model": model_nbytes(gen_model)}
+    memory_monitor.add_components(lambda: model_bytes)
     
-    # Add id column to clustered data if it doesn't exist
-    if 'id' not in clustered_df.columns:
-        clustered_df['id'] = clustered_df['uniq_id']
+    # Product catalogs: data, FAISS index and per-catalog lookup structures.
+    # The models above are shared; pinned catalogs (the default one unless
+    # CATALOG_PINNED says otherwise) load now, the rest on first request
+    catalogs = CatalogRegistry(load_catalog_configs(), admit=memory_monitor.admit)
+    memory_monitor.add_components(lambda: {
+        f"catalog:{c.id}:{name}": size for c in catalogs.loaded() for name, size in c.component_bytes.items()
+    })
+    memory_monitor.add_evictor(catalogs.evict_one)
+    for catalog_id in sorted(catalogs.pinned):
+        catalogs.get(catalog_id)
+    
+    # Recently viewed products per session
+    session_store = make_session_store()
+    
+    # Chat state, and query embeddings shared by chat turns and searches
+    conversation_store = ConversationStore()
+    embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE)
+    
+    # Generated descriptions are deterministic (beam search), so they are cached per product
+    description_cache = LRUCache(int(os.environ.get("DESCRIPTION_CACHE_SIZE", 10000)))
+    
+    memory_monitor.add_caches(lambda: {
+        "embedding_cache": embedding_cache,
+        "description_cache": description_cache,
+        "conversations": conversation_store,
+        **({"sessions": session_store} if hasattr(session_store, "trim") else {}),
+        **{f"cursor_cache:{c.id}": c.candidate_cache for c in catalogs.loaded()},
+    })
     
     print("All models and data loaded successfully!")
 except Exception as e:
@@ -67,10 +135,53 @@ except Exception as e:
 # Define request models
 class SearchQuery(BaseModel):
     query: str
-    top_k: int = 5
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    cursor: Optional[str] = None
+    rerank: bool = False
+    mode: Literal["vector", "lexical", "hybrid"] = "vector"
+    facets: bool = False
+    catalog: str = DEFAULT_CATALOG
 
 class ProductID(BaseModel):
     product_id: str
+    catalog: str = DEFAULT_CATALOG
+
+class ChatMessage(BaseModel):
+    message: str = Field(..., min_length=1, max_length=500)
+    conversation_id: Optional[str] = None
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    stream: bool = True
+    catalog: str = DEFAULT_CATALOG
+
+FacetDimension = Literal["brand", "category", "cluster", "color", "material", "price_band"]
+
+class FacetQuery(BaseModel):
+    filters: Dict[FacetDimension, List[str]] = Field(default_factory=dict)
+    group_by: List[FacetDimension] = Field(default_factory=list, max_length=3)
+    category_level: Optional[int] = Field(None, ge=1)
+    limit: int = Field(FACET_LIMIT, ge=1, le=1000)
+    catalog: str = DEFAULT_CATALOG
+
+class SessionQuery(BaseModel):
+    session_id: Optional[str] = None
+    product_ids: List[str] = Field(default_factory=list, max_length=SESSION_HISTORY)
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    catalog: str = DEFAULT_CATALOG
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Gate admin endpoints on the ADMIN_TOKEN env var; disabled when it is unset"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+def get_catalog(catalog_id):
+    """Resolve a catalog id, loading the catalog if it isn't resident"""
+    try:
+        return catalogs.get(catalog_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown catalog: {catalog_id}")
+    except MemoryBudgetError as e:
+        print(f"Refused to load catalog {catalog_id}: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
 
 # Add a simple test endpoint to verify the server is working
 @app.get("/test")
@@ -83,38 +194,96 @@ def read_root():
     return {"message": "Welcome to the AI Product Recommendation API"}
 
 
+# Collapses concurrent identical /recommend, /search-products and /recommend-by-id work
+singleflight = SingleFlight()
+
+def encode_query(text):
+    """Embed a query, reusing the embedding when the same text was seen recently"""
+    embedding = embedding_cache.get(text)
+    if embedding is None:
+        with torch_ops():
+            embedding = embed_model.encode([text])[0]
+        embedding_cache.put(text, embedding)
+    return embedding
+
+def find_candidates(catalog, query: SearchQuery, depth):
+    """Build the ranked candidate list for a query in its search mode"""
+    index, lexical_index = catalog.index, catalog.lexical_index
+    if query.mode == "lexical":
+        # Pure BM25 - no transformer encode at all
+        return lexical_candidates(lexical_index, query.query, depth)
+    
+    # Encode query
+    query_embedding = encode_query(query.query)
+    if query.mode == "vector":
+        return search_candidates(index, query_embedding, depth)
+    return hybrid_candidates(index, lexical_index, query.query, query_embedding, depth)
+
+def search_page(query: SearchQuery):
+    """Return one page of ranked results for a query, reusing cached candidates for cursors"""
+    catalog = get_catalog(query.catalog)
+    # Cursors are only valid within the catalog that issued them
+    candidate_cache = catalog.candidate_cache
+    # A cursor only continues the query that issued it
+    key = query_key(query.query, query.mode, query.rerank, catalog.id)
+    candidates, token, offset = None, None, 0
+    if query.cursor:
+        try:
+            token, cursor_key, offset = decode_cursor(query.cursor)
+        except CursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        candidates = candidate_cache.get(token)
+        if cursor_key != key or (candidates is not None and candidates.query_key != key):
+            raise HTTPException(status_code=400, detail="Cursor was issued for a different query")
+    
+    if candidates is None:
+        # No usable cursor - search from scratch
+        depth = offset + query.top_k
+        if query.rerank:
+            depth = max(depth, RERANK_DEPTH)
+        if query.facets:
+            depth = max(depth, SEARCH_FACET_DEPTH)
+        candidates = find_candidates(catalog, query, depth)
+        # Near-duplicate listings (dedupe.py) collapse onto their best-ranked member
+        collapse_duplicates(candidates, catalog.canonical)
+        if query.rerank:
+            catalog.reranker.rerank(query.query, candidates, higher_is_better=candidates.higher_is_better)
+        candidates.query_key = key
+        if candidates.degraded:
+            # Some shards missed the deadline: serve this page but don't cache the partial list,
+            # so the next page's cursor misses the cache and searches again
+            token = new_token()
+        else:
+            token = candidate_cache.add(candidates)
+    
+    end = offset + query.top_k
+    ensure_depth(catalog.index, candidates, end, catalog.canonical)
+    
+    # Get product IDs
+    product_ids = [catalog.meta["ids"][i] for i in candidates.indices[offset:end]]
+    print(f"Found product IDs: {product_ids}")
+    
+    results = catalog.products_for_ids(product_ids)
+    has_more = end < len(candidates.indices) or not candidates.exhausted
+    next_cursor = encode_cursor(token, key, end) if has_more else None
+    
+    print(f"Returning {len(results)} results")
+    response = {"results": results, "next_cursor": next_cursor}
+    if query.facets:
+        # Facets describe the top SEARCH_FACET_DEPTH candidates, so they stay the same across pages
+        response["facets"] = catalog.facets.search_facets(catalog.index, candidates, catalog.canonical)
+    return response
+
 @app.post("/search-products")
 def search_products(query: SearchQuery):
     """Handle search queries for product recommendations"""
     try:
-        print(f"Search query: {query.query}, top_k: {query.top_k}")
-        
-        # Encode query
-        query_embedding = embed_model.encode([query.query])[0]
-        
-        # Search in FAISS index
-        D, I = index.search(query_embedding.reshape(1, -1), query.top_k)
-        
-        # Get product IDs
-        product_ids = [meta["ids"][i] for i in I[0]]
-        print(f"Found product IDs: {product_ids}")
-        
-        # Get product details - use both id and uniq_id for compatibility
-        id_results = df[df["id"].isin(product_ids)]
-        uniq_id_results = df[df["uniq_id"].isin(product_ids)]
-        results = pd.concat([id_results, uniq_id_results]).drop_duplicates().to_dict(orient="records")
-        
-        # Ensure id field exists in results
-        for result in results:
-            if "id" not in result and "uniq_id" in result:
-                result["id"] = result["uniq_id"]
-            elif "uniq_id" not in result and "id" in result:
-                result["uniq_id"] = result["id"]
-        
-        print(f"Returning {len(results)} results")
-        return {"results": results}
+        print(f"Search query: {query.query}, top_k: {query.top_k}, cursor: {query.cursor}")
+        return singleflight.do(("search", query.model_dump_json()), lambda: search_page(query))
     except Exception as e:
-        print(f"Error in recommend_products: {str(e)}")
+        print(f"Error in search_products: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
         traceback.print_exc()  # Print full traceback for debugging
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -122,202 +291,442 @@ def search_products(query: SearchQuery):
 def recommend_products(query: SearchQuery):
     """Handle search queries for product recommendations - same as search-products"""
     try:
-        print(f"Received request - Search query: {query.query}, top_k: {query.top_k}")
-        print(f"Query type: {type(query)}, Query object: {query}")
-        
-        # Encode query
-        query_embedding = embed_model.encode([query.query])[0]
-        
-        # Search in FAISS index
-        D, I = index.search(query_embedding.reshape(1, -1), query.top_k)
+        print(f"Received request - Search query: {query.query}, top_k: {query.top_k}, cursor: {query.cursor}")
+        return singleflight.do(("search", query.model_dump_json()), lambda: search_page(query))
+    except Exception as e:
+        print(f"Error in recommend_products: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        traceback.print_exc()  # Print full traceback for debugging
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/suggest")
+def suggest(
+    q: str = Query(..., max_length=200),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=SUGGEST_LIMIT),
+    catalog: str = Query(DEFAULT_CATALOG),
+):
+    """Typeahead completions for the search box - no embedding model involved"""
+    try:
+        return {"query": q, "suggestions": get_catalog(catalog).suggest_index.suggest(q, limit)}
+    except Exception as e:
+        print(f"Error in suggest: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+def similar_to_product(catalog_id, product_id):
+    """Find the products nearest to one product's embedding"""
+    catalog = get_catalog(catalog_id)
+    df, index, meta = catalog.df, catalog.index, catalog.meta
+    # Find product in dataframe
+    product_row = df[df["id"] == product_id]
+    
+    if product_row.empty:
+        # Try with uniq_id if id doesn't match
+        product_row = df[df["uniq_id"] == product_id]
+        if product_row.empty:
+            raise HTTPException(status_code=404, detail="Product not found")
+    
+    # Get product index in meta
+    try:
+        product_idx = catalog.id_to_idx.get(product_id)
+        if product_idx is None:
+            raise ValueError(f"{product_id} is not in the index")
         
-        # Get product IDs
-        product_ids = [meta["ids"][i] for i in I[0]]
-        print(f"Found product IDs: {product_ids}")
+        # Get product embedding
+        product_embedding = index.reconstruct(product_idx)
         
-        # Get product details - use both id and uniq_id for compatibility
-        id_results = df[df["id"].isin(product_ids)]
-        uniq_id_results = df[df["uniq_id"].isin(product_ids)]
-        results = pd.concat([id_results, uniq_id_results]).drop_duplicates().to_dict(orient="records")
+        # Search similar products. Near-duplicate listings (dedupe.py) collapse onto one
+        # hit, so one slot beyond the 5 covers the product's own group, which is dropped
+        canonical = catalog.canonical
+        candidates = collapse_duplicates(search_candidates(index, product_embedding, 6), canonical)
+        ensure_depth(index, candidates, 6, canonical)
+        own_group = group_of(canonical, product_idx)
+        hits = [i for i in candidates.indices if group_of(canonical, i) != own_group][:5]
         
-        # Ensure id field exists in results
-        for result in results:
-            if "id" not in result and "uniq_id" in result:
-                result["id"] = result["uniq_id"]
-            elif "uniq_id" not in result and "id" in result:
-                result["uniq_id"] = result["id"]
+        # Get product details, in ranking order
+        results = catalog.products_for_ids([meta["ids"][i] for i in hits])
         
-        print(f"Returning {len(results)} results")
         return {"results": results}
-    except Exception as e:
-        print(f"Error in recommend_products: {str(e)}")
-        traceback.print_exc()  # Print full traceback for debugging
-        raise HTTPException(status_code=500, detail=str(e))
+    except ValueError as e:
+        print(f"Error finding product index: {str(e)}")
+        # If product not in meta, return empty results
+        return {"results": []}
+    except ShardUnavailableError as e:
+        # The product's vector lives on one shard; without it there is nothing to search with
+        print(f"Shard unavailable for product {product_id}: {e}")
+        raise HTTPException(status_code=503, detail=f"Index shard unavailable, retry shortly: {e}")
 
 @app.post("/recommend-by-id")
 def recommend_by_product_id(product: ProductID):
     """Recommend similar products based on a product ID"""
     try:
         print(f"Recommend for product_id: {product.product_id}")
-        
-        # Find product in dataframe
-        product_row = df[df["id"] == product.product_id]
-        
-        if product_row.empty:
-            # Try with uniq_id if id doesn't match
-            product_row = df[df["uniq_id"] == product.product_id]
-            if product_row.empty:
-                raise HTTPException(status_code=404, detail="Product not found")
-            # Use uniq_id as id for lookup
-            product_id = product.product_id
-        else:
-            product_id = product.product_id
-        
-        # Get product index in meta
-        try:
-            product_idx = meta["ids"].index(product_id)
-            
-            # Get product embedding
-            product_embedding = index.reconstruct(product_idx)
-            
-            # Search similar products
-            D, I = index.search(product_embedding.reshape(1, -1), 6)  # Get 6 to exclude the product itself
-            
-            # Remove the query product (should be the first result)
-            if I[0][0] == product_idx:
-                I = I[0][1:]
-            else:
-                I = I[0][:5]
-            
-            # Get product IDs
-            product_ids = [meta["ids"][i] for i in I]
-            
-            # Get product details
-            results = df[df["id"].isin(product_ids)].to_dict(orient="records")
-            
-            # Ensure id field exists in results
-            for result in results:
-                if "id" not in result and "uniq_id" in result:
-                    result["id"] = result["uniq_id"]
-            
-            return {"results": results}
-        except ValueError as e:
-            print(f"Error finding product index: {str(e)}")
-            # If product not in meta, return empty results
-            return {"results": []}
+        # Concurrent requests for the same product share one lookup and search
+        return singleflight.do(
+            ("recommend-by-id", product.catalog, product.product_id),
+            lambda: similar_to_product(product.catalog, product.product_id),
+        )
     except Exception as e:
         print(f"Error in recommend_by_product_id: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate-description")
-def generate_description(product: ProductID):
-    """Generate creative product description using GenAI"""
+@app.get("/recommend-by-id/{product_id}")
+def recommend_by_product_id_get(product_id: str, request: Request, catalog: str = Query(DEFAULT_CATALOG)):
+    """Cacheable GET form of /recommend-by-id with ETag / 304 support"""
     try:
-        print(f"Generating description for product_id: {product.product_id}")
+        etag = make_etag(get_catalog(catalog).version, catalog, "recommend-by-id", product_id)
+        return cached_response(request, etag, lambda: singleflight.do(
+            ("recommend-by-id", catalog, product_id), lambda: similar_to_product(catalog, product_id)
+        ))
+    except Exception as e:
+        print(f"Error in recommend_by_product_id_get: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/recommend-by-session")
+def recommend_by_session(session: SessionQuery):
+    """Recommend products from recent views/cart adds, excluding what the session has seen"""
+    try:
+        print(f"Session recommend - session_id: {session.session_id}, product_ids: {session.product_ids}")
+        catalog = get_catalog(session.catalog)
+        index, id_to_idx = catalog.index, catalog.id_to_idx
         
-        # Find product in dataframe
-        product_row = df[df["id"] == product.product_id]
+        # Record the new events and use the stored history, or just the ids sent.
+        # Product ids are per catalog, so each catalog keeps its own history
+        if session.session_id:
+            history = session_store.append(f"{catalog.id}:{session.session_id}", session.product_ids)
+        else:
+            history = session.product_ids[-SESSION_HISTORY:]
         
-        if product_row.empty:
-            # Try with uniq_id if id doesn't match
-            product_row = df[df["uniq_id"] == product.product_id]
-            if product_row.empty:
-                raise HTTPException(status_code=404, detail="Product not found")
+        positions = [id_to_idx[pid] for pid in history if pid in id_to_idx]
+        if not positions:
+            return {"results": [], "history": history}
         
-        # Get product details
-        product_data = product_row.iloc[0]
-        title = product_data.get('title', '')
-        brand = product_data.get('brand', '')
-        category = product_data.get('categories', '')
-        material = product_data.get('material', '')
-        color = product_data.get('color', '')
+        # Recency-weighted mean of the session's embeddings, reconstructed in one batch
+        vectors = index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+        weights = np.asarray(recency_weights(len(positions)), dtype=np.float32)
+        session_vector = (weights[:, None] * vectors).sum(axis=0) / weights.sum()
         
-        # Create prompt for description generation
-        prompt = f"Generate a creative and engaging product description for: {title} by {brand}. Category: {category}. Material: {material}. Color: {color}. Make it appealing and highlight key features."
+        # One search, over-fetched by the history size so seen items (and their
+        # near-duplicates) can be dropped
+        canonical = catalog.canonical
+        seen = {group_of(canonical, i) for i in positions}
+        candidates = search_candidates(index, session_vector.astype(np.float32), session.top_k + len(positions))
+        collapse_duplicates(candidates, canonical)
+        hits = [i for i in candidates.indices if group_of(canonical, i) not in seen][:session.top_k]
         
-        # Generate description using the model
-        inputs = tok(prompt, return_tensors="pt", max_length=512, truncation=True)
+        results = catalog.products_for_ids([catalog.meta["ids"][i] for i in hits])
+        return {"results": results, "history": history}
+    except ShardUnavailableError as e:
+        print(f"Shard unavailable in recommend_by_session: {e}")
+        raise HTTPException(status_code=503, detail=f"Index shard unavailable, retry shortly: {e}")
+    except Exception as e:
+        print(f"Error in recommend_by_session: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+def stream_generation(prompt):
+    """Yield flan-t5 output text piece by piece as it is generated"""
+    from transformers import TextIteratorStreamer
+    
+    inputs = tok(prompt, return_tensors="pt", max_length=512, truncation=True).to(gen_model.device)
+    streamer = TextIteratorStreamer(tok, skip_special_tokens=True)
+    # The generation thread doesn't inherit the request's context, so hand it the capture
+    profile = current_profile()
+    
+    def generate(**kwargs):
+        with torch_ops(profile):
+            gen_model.generate(**kwargs)
+    
+    thread = threading.Thread(
+        target=generate,
+        kwargs=dict(**inputs, streamer=streamer, max_new_tokens=CHAT_MAX_NEW_TOKENS),
+        daemon=True,
+    )
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+
+@app.post("/chat")
+def chat(message: ChatMessage):
+    """Conversational recommendations: follow-ups refine the previous search, answers stream as NDJSON"""
+    try:
+        catalog = get_catalog(message.catalog)
+        conversation = conversation_store.get_or_create(message.conversation_id)
+        if conversation.catalog != catalog.id:
+            conversation.catalog = catalog.id
+            conversation.candidates = None
+        query_text, filters, follow_up = rewrite_turn(message.message, conversation, catalog.vocab)
+        print(f"Chat {conversation.id}: {message.message!r} -> query {query_text!r}, filters {filters}, follow_up {follow_up}")
         
-        with torch.no_grad():
-            outputs = gen_model.generate(
-                inputs.input_ids,
-                max_length=150,
-                num_beams=4,
-                early_stopping=True,
-                temperature=0.7
+        # Follow-ups filter the cached candidates; only a new query encodes and searches
+        if not follow_up or conversation.candidates is None:
+            hits = collapse_duplicates(
+                search_candidates(catalog.index, encode_query(query_text), CHAT_DEPTH), catalog.canonical
             )
+            candidates = catalog.products_for_ids([catalog.meta["ids"][i] for i in hits.indices])
+            # A degraded (partial-shard) list serves this turn only; a follow-up searches again
+            conversation.candidates = None if hits.degraded else candidates
+        else:
+            candidates = conversation.candidates
+        results = apply_filters(candidates, filters)[:message.top_k]
+        
+        conversation.query = query_text
+        conversation.filters = filters
+        conversation.last_results = results
+        conversation.turns = (conversation.turns + [message.message])[-10:]
+        
+        header = {
+            "conversation_id": conversation.id,
+            "query": query_text,
+            "filters": filters,
+            "results": results,
+        }
+        prompt = build_prompt(message.message, results)
         
-        generated_text = tok.decode(outputs[0], skip_special_tokens=True)
+        if not message.stream:
+            return {**header, "answer": "".join(stream_generation(prompt))}
         
-        return {"generated": generated_text}
+        def events():
+            yield json.dumps({"type": "results", **header}, default=str) + "\n"
+            try:
+                for text in stream_generation(prompt):
+                    yield json.dumps({"type": "token", "text": text}) + "\n"
+            except Exception as e:
+                print(f"Error streaming chat answer: {str(e)}")
+                yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
         
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+    except Exception as e:
+        print(f"Error in chat: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+def describe_product(catalog_id, product_id):
+    """Generate (or reuse) the creative description for one product"""
+    cached = description_cache.get((catalog_id, product_id))
+    if cached is not None:
+        return cached
+    df = get_catalog(catalog_id).df
+    
+    # Find product in dataframe
+    product_row = df[df["id"] == product_id]
+    
+    if product_row.empty:
+        # Try with uniq_id if id doesn't match
+        product_row = df[df["uniq_id"] == product_id]
+        if product_row.empty:
+            raise HTTPException(status_code=404, detail="Product not found")
+    
+    # Get product details
+    product_data = product_row.iloc[0]
+    title = product_data.get('title', '')
+    brand = product_data.get('brand', '')
+    category = product_data.get('categories', '')
+    material = product_data.get('material', '')
+    color = product_data.get('color', '')
+    
+    # Create prompt for description generation
+    prompt = f"Generate a creative and engaging product description for: {title} by {brand}. Category: {category}. Material: {material}. Color: {color}. Make it appealing and highlight key features."
+    
+    # Generate description using the model
+    inputs = tok(prompt, return_tensors="pt", max_length=512, truncation=True)
+    
+    with torch.no_grad(), torch_ops():
+        outputs = gen_model.generate(
+            inputs.input_ids,
+            max_length=150,
+            num_beams=4,
+            early_stopping=True,
+            temperature=0.7
+        )
+    
+    generated_text = tok.decode(outputs[0], skip_special_tokens=True)
+    
+    result = {"generated": generated_text}
+    description_cache.put((catalog_id, product_id), result)
+    return result
+
+@app.post("/generate-description")
+def generate_description(product: ProductID):
+    """Generate creative product description using GenAI"""
+    try:
+        print(f"Generating description for product_id: {product.product_id}")
+        return describe_product(product.catalog, product.product_id)
     except Exception as e:
         print(f"Error in generate_description: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/generate-description/{product_id}")
+def generate_description_get(product_id: str, request: Request, catalog: str = Query(DEFAULT_CATALOG)):
+    """Cacheable GET form of /generate-description with ETag / 304 support"""
+    try:
+        etag = make_etag(get_catalog(catalog).version, catalog, "generate-description", product_id)
+        return cached_response(request, etag, lambda: describe_product(catalog, product_id))
+    except Exception as e:
+        print(f"Error in generate_description_get: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/analytics")
-def get_analytics():
+def get_analytics(request: Request, catalog: str = Query(DEFAULT_CATALOG)):
     try:
         print("Getting analytics data")
-        
-        # Basic statistics
-        total_count = len(df)
-        price_mean = df['price'].mean() if 'price' in df.columns else 0
-        
-        # Top categories
-        if 'categories' in df.columns:
-            # Parse categories (they're stored as strings like "['Home & Kitchen', 'Furniture']")
-            all_categories = []
-            for cat_str in df['categories'].dropna():
-                try:
-                    # Remove brackets and quotes, then split
-                    cat_str = cat_str.strip("[]'\"")
-                    categories = [c.strip().strip("'\"") for c in cat_str.split(',')]
-                    all_categories.extend(categories)
-                except:
-                    continue
-            
-            from collections import Counter
-            top_categories = dict(Counter(all_categories).most_common(10))
-        else:
-            top_categories = {}
-        
-        # Top brands
-        if 'brand' in df.columns:
-            from collections import Counter
-            top_brands = dict(Counter(df['brand'].dropna()).most_common(10))
-        else:
-            top_brands = {}
-        
-        # Cluster statistics (if available)
-        cluster_stats = []
-        if 'cluster' in clustered_df.columns:
-            try:
-                cluster_stats = clustered_df.groupby("cluster").agg({
-                    "id": "count",
-                    "price": ["mean", "min", "max"] if 'price' in clustered_df.columns else "count"
-                }).reset_index()
-                
-                # Flatten column names
-                cluster_stats.columns = ["cluster", "count", "avg_price", "min_price", "max_price"]
-                cluster_stats = cluster_stats.to_dict(orient="records")
-            except Exception as e:
-                print(f"Error processing cluster stats: {e}")
-                cluster_stats = []
-        
-        return {
-            "count": total_count,
-            "price_mean": price_mean,
-            "top_categories": top_categories,
-            "top_brands": top_brands,
-            "cluster_stats": cluster_stats
-        }
+        resolved = get_catalog(catalog)
+        return cached_response(request, make_etag(resolved.version, catalog, "analytics"), lambda: resolved.analytics)
     except Exception as e:
         print(f"Error in get_analytics: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analytics/query")
+def query_analytics(query: FacetQuery):
+    """Counts and price stats sliced by brand, category, cluster, color, material or price band"""
+    try:
+        print(f"Analytics query - filters: {query.filters}, group_by: {query.group_by}")
+        return get_catalog(query.catalog).facets.query(
+            query.filters, query.group_by, category_level=query.category_level, limit=query.limit
+        )
+    except Exception as e:
+        print(f"Error in query_analytics: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
+
+def warmup_steps():
+    """Representative calls that pay the lazy-initialization costs before real traffic does"""
+    top_queries = load_top_queries()
+
+    def encode():
+        # Both single queries and small batches, so each kernel path gets dispatched once
+        embed_model.encode(["warm up"])
+        embed_model.encode(top_queries[:32])
+
+    def search(catalog):
+        # Replaying top queries fills the embedding cache and faults in the index pages they touch
+        for text in top_queries:
+            search_page(SearchQuery(query=text, catalog=catalog.id))
+        search_page(SearchQuery(query=top_queries[0], mode="hybrid", rerank=True, facets=True, catalog=catalog.id))
+
+    def generate():
+        inputs = tok("Describe a wooden chair.", return_tensors="pt").to(gen_model.device)
+        with torch.no_grad():
+            # Greedy (chat) and beam search (descriptions) take different code paths
+            gen_model.generate(**inputs, max_new_tokens=8)
+            gen_model.generate(**inputs, max_length=16, num_beams=4, early_stopping=True)
+
+    steps = [("encode", encode)]
+    steps += [(f"search:{c.id}", lambda c=c: search(c)) for c in catalogs.loaded()]
+    if WARMUP_GENERATE:
+        steps.append(("generate", generate))
+    return steps
+
+# Warm-up runs in every worker process (after fork under gunicorn), in the background;
+# /ready answers 503 until it is done
+readiness = Readiness()
+
+@app.on_event("startup")
+def start_shards():
+    # Blocks startup until every shard has loaded (or the shard server is reachable), so no
+    # request is served - and no search deadline spent - while shards are still starting
+    for catalog in catalogs.loaded():
+        if isinstance(catalog.index, ShardedIndex):
+            catalog.index.start()
+
+@app.on_event("startup")
+def start_warmup():
+    readiness.start(warmup_steps())
+
+@app.on_event("startup")
+def start_memory_monitor():
+    # Per worker, like warm-up: each process checks its own RSS
+    memory_monitor.start()
+
+@app.get("/ready")
+def ready():
+    """Readiness probe for load balancers: 200 once this worker is warm, 503 before"""
+    status = readiness.snapshot()
+    if not status["ready"]:
+        return JSONResponse(status, status_code=503)
+    return status
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+def memory_status():
+    """Estimated bytes per loaded component and cache, process RSS and budgets"""
+    return memory_monitor.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Memory gauges in Prometheus text format"""
+    return memory_monitor.prometheus()
+
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+def admin_stats():
+    """Runtime counters for caches and request coalescing"""
+    return {
+        "singleflight": singleflight.snapshot(),
+        "reranker": {c.id: c.reranker.stats for c in catalogs.loaded()},
+        "cursor_cache_entries": sum(len(c.candidate_cache) for c in catalogs.loaded()),
+        "embedding_cache_entries": len(embedding_cache),
+        "query_log": query_log_writer.stats if query_log_writer else None,
+    }
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+def start_profile(seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS)):
+    """Profile the whole process for a time window; download the result from /admin/profiles/{id}"""
+    profile_id = profile_window(seconds)
+    if profile_id is None:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    return {"profile_id": profile_id, "ready_in_seconds": seconds}
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def download_profile(profile_id: str):
+    """Zip with folded stacks (flame graph input), a call tree and torch op timings"""
+    path = artifact_path(os.path.basename(profile_id))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found or still running")
+    return FileResponse(path, media_type="application/zip", filename=os.path.basename(path))
+
+@app.get("/admin/catalogs", dependencies=[Depends(require_admin)])
+def catalog_status():
+    """Configured and resident catalogs, their approximate size and load/eviction counts"""
+    return catalogs.status()
+
+@app.get("/admin/shards", dependencies=[Depends(require_admin)])
+def shard_status(catalog: str = Query(DEFAULT_CATALOG)):
+    """Per-shard layout plus timeout and degraded-answer counters"""
+    index = get_catalog(catalog).index
+    if not isinstance(index, ShardedIndex):
+        raise HTTPException(status_code=404, detail="Sharding is not enabled")
+    return {"shards": index.shards, "stats": index.stats}
+
+@app.post("/admin/shards/{shard_id}/reload", dependencies=[Depends(require_admin)])
+def reload_shard(shard_id: int, catalog: str = Query(DEFAULT_CATALOG)):
+    """Swap in a rebuilt shard file without restarting the other shards"""
+    index = get_catalog(catalog).index
+    if not isinstance(index, ShardedIndex):
+        raise HTTPException(status_code=404, detail="Sharding is not enabled")
+    if not 0 <= shard_id < len(index.shards):
+        raise HTTPException(status_code=404, detail="Shard not found")
+    try:
+        return {"shard": shard_id, "ntotal": index.reload_shard(shard_id)}
+    except Exception as e:
+        print(f"Error reloading shard {shard_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Run the app
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Build the catalog FAISS index at a chosen storage precision.
+
+Examples (run from the project root):
+
+    # Re-store the existing float32 index as 8-bit scalar-quantized, keeping a
+    # float32 memmap for exact re-ranking
+    python backend/build_index.py --precision sq8 --out models/faiss_index_sq8.bin \
+        --exact-vectors models/vectors_f32.npy
+
+    # Compare memory and recall for every precision
+    python backend/build_index.py --report
+
+    # Same for the image embeddings
+    python backend/build_index.py --vectors models/image_embeddings.pkl --report
+
+    # Re-embed the catalog incrementally (only new/changed rows hit the encoder)
+    # and write a fresh index plus meta.pkl
+    python backend/build_index.py --catalog data/cleaned_products.csv \
+        --out models/faiss_index.bin --meta models/meta.pkl
+
+    # Split the catalog into 4 shards for SHARD_DIR serving, then rebuild just shard 2
+    python backend/build_index.py --shards 4 --shard-dir models/shards
+    python backend/build_index.py --shard-dir models/shards --rebuild-shard 2
+"""
+import argparse
+import os
+import pickle
+import time
+
+import faiss
+import numpy as np
+
+from quantize import PRECISIONS, ExactRerankIndex, build_index, index_footprint
+from sharding import build_shards, rebuild_shard
+from embedding_store import embed_catalog
+
+
+def load_vectors(path):
+    """Load float32 vectors from a FAISS index, a .npy file or a pickled array/list"""
+    if path.endswith(".bin"):
+        index = faiss.read_index(path)
+        return index.reconstruct_n(0, index.ntotal), index.metric_type
+    if path.endswith(".npy"):
+        return np.load(path).astype(np.float32), None
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    if isinstance(data, dict):
+        data = list(data.values())
+    return np.vstack([np.asarray(v, dtype=np.float32).ravel() for v in data]), None
+
+
+def recall_at_k(exact_ids, approx_ids, k):
+    hits = sum(len(set(e[:k]) & set(a[:k])) for e, a in zip(exact_ids, approx_ids))
+    return hits / (len(exact_ids) * k)
+
+
+def report(vectors, metric, k, num_queries, pq_m):
+    """Print per-vector and fixed memory, and recall@k against exact float32 search"""
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)]
+    exact = build_index(vectors, "fp32", metric)
+    _, exact_ids = exact.search(queries, k)
+
+    print(f"{len(vectors)} vectors, d={vectors.shape[1]}, {len(queries)} queries, recall@{k}")
+    print(f"{'precision':<10}{'bytes/vec':>10}{'MB per 1M':>11}{'fixed KB':>10}{'recall':>9}{'+exact':>9}{'ms/query':>10}")
+    for precision in PRECISIONS:
+        index = build_index(vectors, precision, metric, pq_m=pq_m)
+        start = time.perf_counter()
+        _, ids = index.search(queries, k)
+        elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+        # Per-vector codes scale with the catalog; codebooks and quantizer ranges don't
+        code_size, fixed = index_footprint(index)
+
+        reranked = ExactRerankIndex(index, vectors)
+        _, rerank_ids = reranked.search(queries, k)
+        print(
+            f"{precision:<10}{code_size:>10}{code_size * 1e6 / 2**20:>11.1f}{fixed / 1024:>10.1f}"
+            f"{recall_at_k(exact_ids, ids, k):>9.3f}{recall_at_k(exact_ids, rerank_ids, k):>9.3f}"
+            f"{elapsed:>10.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a (quantized) FAISS catalog index")
+    parser.add_argument("--vectors", default="models/faiss_index.bin",
+                        help="Source vectors: a FAISS index, .npy file or pickled embeddings")
+    parser.add_argument("--catalog", default=None,
+                        help="Embed this products CSV instead of reading --vectors (incremental via --store)")
+    parser.add_argument("--encoder", default="all-MiniLM-L6-v2", help="SentenceTransformer used with --catalog")
+    parser.add_argument("--encoder-version", default=None,
+                        help="Bump to invalidate stored embeddings (defaults to the encoder name)")
+    parser.add_argument("--store", default="models/embedding_store", help="Persistent embedding store")
+    parser.add_argument("--meta", default=None, help="Write the id list used by the app (with --catalog)")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32")
+    parser.add_argument("--metric", choices=["ip", "l2"], default=None,
+                        help="Distance metric (defaults to the source index's metric, else ip)")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (must divide d)")
+    parser.add_argument("--out", default=None, help="Where to write the built index")
+    parser.add_argument("--exact-vectors", default=None,
+                        help="Also write the float32 vectors as .npy for exact re-ranking at load")
+    parser.add_argument("--shards", type=int, default=None, help="Split the index into this many shards")
+    parser.add_argument("--shard-dir", default="models/shards", help="Where shard files and manifest live")
+    parser.add_argument("--rebuild-shard", type=int, default=None, help="Rebuild only this shard")
+    parser.add_argument("--report", action="store_true", help="Print the memory/recall report")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Paths are relative to the project root, like the app's
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    if args.catalog:
+        import pandas as pd
+
+        ids, vectors = embed_catalog(pd.read_csv(args.catalog), args.encoder, args.store, args.encoder_version)
+        source_metric = faiss.METRIC_INNER_PRODUCT
+        if args.meta:
+            with open(args.meta, "wb") as f:
+                pickle.dump({"ids": ids}, f)
+            print(f"Wrote {len(ids)} ids to {args.meta}")
+    else:
+        vectors, source_metric = load_vectors(args.vectors)
+    if args.metric:
+        metric = faiss.METRIC_INNER_PRODUCT if args.metric == "ip" else faiss.METRIC_L2
+    else:
+        metric = source_metric if source_metric is not None else faiss.METRIC_INNER_PRODUCT
+
+    if args.report:
+        report(vectors, metric, args.k, args.queries, args.pq_m)
+
+    if args.out:
+        index = build_index(vectors, args.precision, metric, pq_m=args.pq_m)
+        faiss.write_index(index, args.out)
+        code_size, fixed = index_footprint(index)
+        print(f"Wrote {args.precision} index with {index.ntotal} vectors to {args.out} "
+              f"({code_size} bytes/vector + {fixed / 1024:.1f} KB fixed)")
+    if args.shards:
+        manifest = build_shards(vectors, args.shards, args.shard_dir, args.precision, metric)
+        print(f"Wrote {len(manifest['shards'])} {args.precision} shards to {args.shard_dir}")
+    if args.rebuild_shard is not None:
+        shard = rebuild_shard(vectors, args.shard_dir, args.rebuild_shard)
+        print(f"Rebuilt {shard['path']} ({shard['ntotal']} vectors); "
+              f"POST /admin/shards/{args.rebuild_shard}/reload to pick it up")
+    if args.exact_vectors:
+        np.save(args.exact_vectors, vectors)
+        print(f"Wrote float32 vectors to {args.exact_vectors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import json
+import os
+import pickle
+import threading
+from collections import Counter, OrderedDict
+
+import faiss
+import numpy as np
+import pandas as pd
+
+from chat import Vocabulary
+from facets import FacetEngine
+from http_cache import artifact_version
+from lexical import BM25Index
+from memory import frame_nbytes, index_nbytes, object_nbytes
+from pagination import CandidateCache
+from quantize import load_index
+from rerank import Reranker
+from sharding import ShardedIndex
+from suggest import SuggestIndex
+
+DEFAULT_CATALOG = "default"
+# JSON file mapping catalog id -> artifact paths; without it only the default catalog exists
+CATALOGS_CONFIG = os.environ.get("CATALOGS_CONFIG", "")
+# Evict least recently used catalogs once resident ones exceed this (0 = no limit)
+CATALOG_MEMORY_BUDGET_MB = float(os.environ.get("CATALOG_MEMORY_BUDGET_MB", 0))
+# Comma-separated catalog ids loaded at startup and never evicted
+CATALOG_PINNED = [c for c in os.environ.get("CATALOG_PINNED", DEFAULT_CATALOG).split(",") if c]
+
+
+def default_catalog_config():
+    """The single-catalog layout, configured through the same env vars as before"""
+    return {
+        "data": "data/cleaned_products.csv",
+        "clustered": "data/clustered_products.csv",
+        "meta": "models/meta.pkl",
+        "index": os.environ.get("INDEX_PATH", "models/faiss_index.bin"),
+        "exact_vectors": os.environ.get("EXACT_VECTORS_PATH"),
+        "shard_dir": os.environ.get("SHARD_DIR"),
+        "mmap": os.environ.get("FAISS_MMAP", "0") == "1",
+        "duplicates": os.environ.get("DUPLICATES_PATH", "models/duplicates.npy"),
+    }
+
+
+def load_catalog_configs(path=CATALOGS_CONFIG):
+    """Catalog id -> config: the default catalog plus the ones listed in `path`.
+
+    A listed catalog inherits nothing but the mmap setting from the default one,
+    so it must name its own data, meta and index (or shard_dir).
+    """
+    configs = {DEFAULT_CATALOG: default_catalog_config()}
+    if path:
+        with open(path) as f:
+            for catalog_id, config in json.load(f).items():
+                if catalog_id == DEFAULT_CATALOG:
+                    configs[catalog_id] = {**configs[catalog_id], **config}
+                    continue
+                missing = [key for key in ("data", "meta") if not config.get(key)]
+                if not config.get("index") and not config.get("shard_dir"):
+                    missing.append("index")
+                if missing:
+                    raise ValueError(f"Catalog {catalog_id!r} in {path} is missing {', '.join(missing)}")
+                optional = {
+                    "clustered": None,
+                    "index": None,
+                    "exact_vectors": None,
+                    "shard_dir": None,
+                    "mmap": configs[DEFAULT_CATALOG]["mmap"],
+                    "duplicates": None,
+                }
+                configs[catalog_id] = {**optional, **config}
+    return configs
+
+
+def load_meta(path):
+    """Load meta.pkl as {"ids": [...]}; older builds pickled the bare id list"""
+    with open(path, "rb") as f:
+        meta = pickle.load(f)
+    ids = meta["ids"] if isinstance(meta, dict) else list(meta)
+    return {"ids": ids}
+
+
+class Catalog:
+    """One product catalog: its data, vector index and the lookup structures built from them"""
+
+    def __init__(self, catalog_id, config):
+        self.id = catalog_id
+        self.config = config
+        print(f"Loading catalog {catalog_id}")
+
+        # Load product dataset
+        self.df = pd.read_csv(config["data"])
+
+        # Add id column if it doesn't exist (use uniq_id as id)
+        if 'id' not in self.df.columns:
+            self.df['id'] = self.df['uniq_id']
+
+        # Load FAISS index - mmap maps it read-only so worker processes share the pages.
+        # The index may be a quantized build; exact_vectors adds exact float32 re-ranking.
+        # shard_dir switches to scatter-gather search over per-shard worker processes
+        if config.get("shard_dir"):
+            self.index = ShardedIndex(config["shard_dir"])
+        else:
+            self.index = load_index(
+                config["index"], exact_vectors_path=config.get("exact_vectors"), mmap=config.get("mmap", False)
+            )
+
+        # Load metadata
+        self.meta = load_meta(config["meta"])
+
+        # Load clustered data
+        self.clustered_df = pd.read_csv(config["clustered"]) if config.get("clustered") else pd.DataFrame()
+
+        # Add id column to clustered data if it doesn't exist
+        if 'id' not in self.clustered_df.columns and 'uniq_id' in self.clustered_df.columns:
+            self.clustered_df['id'] = self.clustered_df['uniq_id']
+
+        ids = self.meta["ids"]
+        # Second-stage re-ranker over FAISS candidates
+        self.reranker = Reranker(self.df, ids, self.index.metric_type == faiss.METRIC_INNER_PRODUCT)
+        # BM25 index over title/brand/description/text for exact-term matches
+        self.lexical_index = BM25Index(self.df, ids)
+        # Prefix index for typeahead over titles, brands and categories
+        self.suggest_index = SuggestIndex(self.df)
+        # Product id -> FAISS position, so lookups don't scan meta["ids"]
+        self.id_to_idx = {pid: i for i, pid in enumerate(ids)}
+        # Catalog colors and brands for chat follow-ups
+        self.vocab = Vocabulary(self.df)
+        # Pre-aggregated cube for sliced analytics and search facets
+        self.facets = FacetEngine(self.df, self.clustered_df, ids)
+        # Canonical FAISS position per position from dedupe.py, or None when no job has run
+        self.canonical = self._load_duplicates(config.get("duplicates"))
+        # Candidate lists kept between pages so later pages skip the encode and search
+        self.candidate_cache = CandidateCache()
+
+        # Fingerprint of the loaded artifacts, used in ETags
+        self.version = artifact_version([
+            config["data"],
+            config.get("clustered"),
+            config["meta"],
+            config.get("index"),
+            config.get("duplicates"),
+            os.path.join(config["shard_dir"], "manifest.json") if config.get("shard_dir") else None,
+        ])
+        # The catalog is static, so the summary is computed once at load (before any worker fork)
+        self.analytics = self.compute_analytics()
+        # Sizes are measured once: everything above is read-only after load
+        self.component_bytes = self._measure()
+        print(f"Catalog {catalog_id} loaded: {len(self.df)} products, version {self.version}, "
+              f"~{self.nbytes() / 2**20:.1f} MB")
+
+    def _load_duplicates(self, path):
+        if not path or not os.path.exists(path):
+            return None
+        canonical = np.load(path)
+        if len(canonical) != self.index.ntotal:
+            print(f"Ignoring {path}: {len(canonical)} entries for {self.index.ntotal} vectors (re-run dedupe.py)")
+            return None
+        print(f"Collapsing near-duplicates: {int((canonical != np.arange(len(canonical))).sum())} products map to another")
+        return canonical
+
+    def products_for_ids(self, product_ids):
+        """Look up product rows for FAISS hits, keeping the ranking order"""
+        df = self.df
+        # Get product details - use both id and uniq_id for compatibility
+        id_results = df[df["id"].isin(product_ids)]
+        uniq_id_results = df[df["uniq_id"].isin(product_ids)]
+        matches = pd.concat([id_results, uniq_id_results]).drop_duplicates(subset=["uniq_id"])
+        rank = {pid: i for i, pid in enumerate(product_ids)}
+        results = sorted(
+            matches.to_dict(orient="records"),
+            key=lambda r: rank.get(r["id"], rank.get(r["uniq_id"], len(rank))),
+        )
+
+        # Ensure id field exists in results
+        for result in results:
+            if "id" not in result and "uniq_id" in result:
+                result["id"] = result["uniq_id"]
+            elif "uniq_id" not in result and "id" in result:
+                result["uniq_id"] = result["id"]
+        return results
+
+    def compute_analytics(self):
+        """Summarise the catalog for the analytics dashboard"""
+        df, clustered_df = self.df, self.clustered_df
+        # Basic statistics
+        total_count = len(df)
+        price_mean = df['price'].mean() if 'price' in df.columns else 0
+
+        # Top categories
+        if 'categories' in df.columns:
+            # Parse categories (they're stored as strings like "['Home & Kitchen', 'Furniture']")
+            all_categories = []
+            for cat_str in df['categories'].dropna():
+                try:
+                    # Remove brackets and quotes, then split
+                    cat_str = cat_str.strip("[]'\"")
+                    categories = [c.strip().strip("'\"") for c in cat_str.split(',')]
+                    all_categories.extend(categories)
+                except:
+                    continue
+
+            top_categories = dict(Counter(all_categories).most_common(10))
+        else:
+            top_categories = {}
+
+        # Top brands
+        if 'brand' in df.columns:
+            top_brands = dict(Counter(df['brand'].dropna()).most_common(10))
+        else:
+            top_brands = {}
+
+        # Cluster statistics (if available)
+        cluster_stats = []
+        if 'cluster' in clustered_df.columns:
+            try:
+                cluster_stats = clustered_df.groupby("cluster").agg({
+                    "id": "count",
+                    "price": ["mean", "min", "max"] if 'price' in clustered_df.columns else "count"
+                }).reset_index()
+
+                # Flatten column names
+                cluster_stats.columns = ["cluster", "count", "avg_price", "min_price", "max_price"]
+                cluster_stats = cluster_stats.to_dict(orient="records")
+            except Exception as e:
+                print(f"Error processing cluster stats: {e}")
+                cluster_stats = []
+
+        return {
+            "count": total_count,
+            "price_mean": price_mean,
+            "top_categories": top_categories,
+            "top_brands": top_brands,
+            "cluster_stats": cluster_stats
+        }
+
+    def _measure(self):
+        lexical = self.lexical_index
+        return {
+            "df": frame_nbytes(self.df),
+            "clustered_df": frame_nbytes(self.clustered_df),
+            "index": index_nbytes(self.index),
+            "meta": object_nbytes(self.meta),
+            "id_to_idx": object_nbytes(self.id_to_idx),
+            "lexical_index": lexical.nbytes() + object_nbytes(lexical.vocab),
+            "suggest_index": object_nbytes(self.suggest_index),
+            "facets": self.facets.nbytes(),
+            "duplicates": self.canonical.nbytes if self.canonical is not None else 0,
+        }
+
+    def nbytes(self):
+        """Approximate resident size of the catalog's data, index and lookup structures"""
+        return sum(self.component_bytes.values())
+
+    def close(self):
+        if isinstance(self.index, ShardedIndex):
+            self.index.close()
+
+
+class CatalogRegistry:
+    """Loads catalogs on first use and keeps hot ones resident under a memory budget.
+
+    Concurrent first requests for the same catalog share one load. After
+    each load, least recently used catalogs are evicted (pinned ones never)
+    until the resident total fits CATALOG_MEMORY_BUDGET_MB.
+    """
+
+    def __init__(self, configs, budget_mb=CATALOG_MEMORY_BUDGET_MB, pinned=CATALOG_PINNED, admit=None):
+        self.configs = configs
+        # Called as admit(name, estimated_bytes) before each load; may raise to refuse it
+        self.admit = admit
+        self.budget = budget_mb * 2**20
+        self.pinned = set(pinned)
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.stats = {"loads": 0, "evictions": 0}
+
+    def get(self, catalog_id):
+        with self._lock:
+            catalog = self._loaded.get(catalog_id)
+            if catalog is not None:
+                self._loaded.move_to_end(catalog_id)
+                return catalog
+            if catalog_id not in self.configs:
+                raise KeyError(catalog_id)
+            load_lock = self._loading.setdefault(catalog_id, threading.Lock())
+
+        # Load outside the registry lock so other catalogs keep serving
+        with load_lock:
+            with self._lock:
+                catalog = self._loaded.get(catalog_id)
+            if catalog is None:
+                if self.admit is not None:
+                    self.admit(f"catalog {catalog_id}", self.estimate_bytes(catalog_id))
+                catalog = Catalog(catalog_id, self.configs[catalog_id])
+                with self._lock:
+                    self._loaded[catalog_id] = catalog
+                    self.stats["loads"] += 1
+                    evicted = self._evict(keep=catalog_id)
+                for old in evicted:
+                    old.close()
+            return catalog
+
+    def _evict(self, keep):
+        evicted = []
+        if self.budget <= 0:
+            return evicted
+        total = sum(c.nbytes() for c in self._loaded.values())
+        for catalog_id in list(self._loaded):
+            if total <= self.budget:
+                break
+            if catalog_id == keep or catalog_id in self.pinned:
+                continue
+            catalog = self._loaded.pop(catalog_id)
+            total -= catalog.nbytes()
+            evicted.append(catalog)
+            self.stats["evictions"] += 1
+            print(f"Evicted catalog {catalog_id} to stay under the memory budget")
+        return evicted
+
+    def estimate_bytes(self, catalog_id):
+        """Rough size of a catalog before loading it: its artifact files on disk"""
+        config = self.configs[catalog_id]
+        paths = [config.get(key) for key in ("data", "clustered", "meta", "duplicates")]
+        if not config.get("shard_dir"):
+            paths.append(config.get("index"))
+        return sum(os.path.getsize(p) for p in paths if p and os.path.exists(p))
+
+    def evict_one(self):
+        """Drop the least recently used unpinned catalog; False when none is left"""
+        with self._lock:
+            victim = next((c for c in self._loaded if c not in self.pinned), None)
+            if victim is None:
+                return False
+            catalog = self._loaded.pop(victim)
+            self.stats["evictions"] += 1
+        print(f"Evicted catalog {victim} to stay under MEMORY_BUDGET_MB")
+        catalog.close()
+        return True
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded.values())
+
+    def status(self):
+        return {
+            "configured": sorted(self.configs),
+            "resident": {c.id: {"mb": round(c.nbytes() / 2**20, 1), "version": c.version} for c in self.loaded()},
+            "budget_mb": self.budget / 2**20,
+            "pinned": sorted(self.pinned),
+            **self.stats,
+        }
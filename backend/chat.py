@@ -0,0 +1,212 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from rerank import parse_price_cap, tokenize
+
+# Candidates kept per conversation so follow-up turns filter instead of re-searching
+CHAT_DEPTH = int(os.environ.get("CHAT_DEPTH", 100))
+CHAT_TTL_SECONDS = float(os.environ.get("CHAT_TTL_SECONDS", 900))
+CHAT_MAX_CONVERSATIONS = int(os.environ.get("CHAT_MAX_CONVERSATIONS", 10000))
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096))
+CHAT_MAX_NEW_TOKENS = int(os.environ.get("CHAT_MAX_NEW_TOKENS", 120))
+
+_CHEAPER_RE = re.compile(r"\b(cheaper|less expensive|lower price|budget)\b")
+_RESET_RE = re.compile(r"\b(any price|any colou?r|any brand|clear filters|start over)\b")
+# Words that can surround a refinement without making it a new request
+_FOLLOW_UP_WORDS = set(
+    "a an any anything and are below brand by can cheaper clear colour color do expensive filters for have i in "
+    "is it less lower me more now one ones only or over please price show some something start than "
+    "that the them these those under want what with you budget".split()
+)
+
+
+class LRUCache:
+    """Small thread-safe LRU map; with a ttl, entries also expire that long after their last put.
+
+    __len__, sample and trim are what MemoryMonitor uses to size and shrink it.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expiry on the monotonic clock or None, value), least recently used first
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        """The unexpired entry for key, marked as recently used; callers hold the lock"""
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return entry
+
+    def _store(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._items[key] = (expires_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[1] if entry else None
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def update(self, key, fn):
+        """Store fn(current value, or None) under key in one step and return it"""
+        with self._lock:
+            entry = self._live(key)
+            value = fn(entry[1] if entry else None)
+            self._store(key, value)
+            return value
+
+    def __len__(self):
+        return len(self._items)
+
+    def sample(self, n):
+        """Up to n of the most recently used values"""
+        with self._lock:
+            return [entry[1] for _, entry in zip(range(n), reversed(self._items.values()))]
+
+    def trim(self, fraction):
+        """Evict the least recently used `fraction` of the entries"""
+        with self._lock:
+            keep = int(len(self._items) * (1 - fraction))
+            while len(self._items) > keep:
+                self._items.popitem(last=False)
+
+
+class Conversation:
+    """Short state for one chat: the base query, active filters and its candidate products"""
+
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        # Catalog the candidates came from; switching catalogs starts a fresh search
+        self.catalog = None
+        self.query = None
+        self.filters = {}
+        # Product records for the top CHAT_DEPTH hits of `query`, best first
+        self.candidates = None
+        self.last_results = []
+        self.turns = []
+
+
+class ConversationStore(LRUCache):
+    """Bounded, TTL-evicted conversations keyed by id"""
+
+    def __init__(self, max_entries=CHAT_MAX_CONVERSATIONS, ttl=CHAT_TTL_SECONDS):
+        super().__init__(max_entries, ttl)
+
+    def get_or_create(self, conversation_id=None):
+        conversation = self.get(conversation_id) if conversation_id else None
+        if conversation is None:
+            conversation = Conversation(conversation_id or uuid.uuid4().hex)
+        # Every turn restarts the conversation's TTL
+        self.put(conversation.id, conversation)
+        return conversation
+
+
+class Vocabulary:
+    """Catalog colors and brands, for spotting refinements like "in black" """
+
+    def __init__(self, df):
+        self.colors = self._values(df, "color")
+        self.brands = self._values(df, "brand")
+
+    @staticmethod
+    def _values(df, column):
+        if column not in df.columns:
+            return set()
+        values = df[column].dropna().astype(str).str.strip().str.lower()
+        # Long free-text values are descriptions, not something a user would type
+        return {v for v in values.unique() if v and len(v.split()) <= 2}
+
+    def find(self, message, values):
+        text = " " + " ".join(tokenize(message)) + " "
+        matches = [v for v in values if " " + " ".join(tokenize(v)) + " " in text]
+        # Prefer the most specific match ("light grey" over "grey")
+        return max(matches, key=len) if matches else None
+
+
+def rewrite_turn(message, conversation, vocab):
+    """Turn a chat message into (search query, filters, is_follow_up).
+
+    Follow-ups ("cheaper", "in black", "under $100") refine the previous
+    query's filters; anything else starts a new search.
+    """
+    lower = message.lower()
+    reset = bool(_RESET_RE.search(lower))
+    stated = {}
+    cap = parse_price_cap(message)
+    if cap is not None:
+        stated["max_price"] = cap
+    elif _CHEAPER_RE.search(lower):
+        prices = [p for p in (_price(r) for r in conversation.last_results) if p > 0]
+        # Nothing priced to undercut yet - still a refinement, just without a ceiling
+        stated["max_price"] = min(prices) - 0.01 if prices else None
+    color = vocab.find(message, vocab.colors)
+    if color:
+        stated["color"] = color
+    brand = vocab.find(message, vocab.brands)
+    if brand:
+        stated["brand"] = brand
+
+    refined = reset or bool(stated)
+    stated = {k: v for k, v in stated.items() if v is not None}
+    # A refinement with nothing else in it ("cheaper", "in black") keeps the old query
+    leftover = set(tokenize(message)) - _FOLLOW_UP_WORDS
+    for value in (color, brand):
+        leftover -= set(tokenize(value or ""))
+    leftover = {t for t in leftover if not t.replace(".", "").isdigit()}
+    if conversation.query and refined and not leftover:
+        filters = {} if reset else dict(conversation.filters)
+        filters.update(stated)
+        return conversation.query, filters, True
+    return message, stated, False
+
+
+def _price(record):
+    price = record.get("price") or 0
+    # Missing prices come through as NaN
+    return price if price == price else 0
+
+
+def apply_filters(results, filters):
+    """Filter product records by the conversation's price/color/brand constraints"""
+    kept = []
+    for r in results:
+        price = _price(r)
+        if "max_price" in filters and not (0 < price <= filters["max_price"]):
+            continue
+        if "color" in filters and filters["color"] not in str(r.get("color", "")).lower():
+            continue
+        if "brand" in filters and str(r.get("brand", "")).strip().lower() != filters["brand"]:
+            continue
+        kept.append(r)
+    return kept
+
+
+def build_prompt(message, results):
+    if not results:
+        return f"A shopper asked: {message}. No matching products were found. Politely suggest they broaden the search."
+    lines = []
+    for i, r in enumerate(results, 1):
+        price = _price(r)
+        price_text = f", ${price:.2f}" if price else ""
+        lines.append(f"{i}. {r.get('title', '')} ({r.get('brand', '')}{price_text})")
+    return (
+        f"A shopper asked: {message}. Recommend these products in a friendly, helpful reply, "
+        f"mentioning why they fit: " + " ".join(lines)
+    )
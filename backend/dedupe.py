@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Group near-duplicate products and write the canonical-id mapping search collapses on.
+
+    python backend/dedupe.py --out models/duplicates.npy --groups models/duplicates.json
+
+Pairs come from the catalog embeddings (blocked k-NN, or range search with
+--method range) and are kept only when their titles also agree under
+MinHash. Accepted pairs are merged into groups with union-find. The output
+is an int32 array: the canonical FAISS position for every position. It is
+loaded next to the index, so collapsing a result list costs one array
+lookup per hit.
+"""
+import argparse
+import json
+import os
+import time
+import zlib
+
+import faiss
+import numpy as np
+import pandas as pd
+
+from build_index import load_vectors
+from catalogs import load_meta
+from rerank import tokenize
+
+# Mersenne prime for the MinHash permutations; hashes are reduced below it
+_PRIME = (1 << 31) - 1
+
+
+def shingles(text, n):
+    tokens = tokenize(text)
+    if len(tokens) < n:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=2, seed=0):
+    """MinHash signatures (one row per text); rows of texts without shingles are flagged empty"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+    signatures = np.full((len(texts), num_perm), _PRIME, dtype=np.uint64)
+    empty = np.zeros(len(texts), dtype=bool)
+    for row, text in enumerate(texts):
+        hashed = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles(text, shingle_size)), dtype=np.uint64
+        )
+        if not len(hashed):
+            empty[row] = True
+            continue
+        # (a*x + b) mod p stays below 2**63 since a, x < 2**31
+        signatures[row] = ((np.outer(hashed, a) + b) % _PRIME).min(axis=0)
+    return signatures, empty
+
+
+def candidate_pairs(vectors, threshold, method="knn", k=10, block_size=4096, nlist=0, nprobe=8):
+    """(i, j, cosine) pairs with i < j and similarity >= threshold, searched block by block"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).copy()
+    faiss.normalize_L2(vectors)
+    d = vectors.shape[1]
+    if nlist:
+        # Approximate: only the nprobe nearest lists are compared, instead of every vector
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = nprobe
+    else:
+        index = faiss.IndexFlatIP(d)
+    index.add(vectors)
+
+    rows, cols, sims = [], [], []
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        query_ids = np.arange(start, start + len(block))
+        if method == "range":
+            lims, D, I = index.range_search(block, threshold)
+            # lims is uint64, which np.repeat won't cast to its int64 counts
+            q = np.repeat(query_ids, np.diff(lims).astype(np.int64))
+        else:
+            D, I = index.search(block, min(k + 1, index.ntotal))
+            q = np.repeat(query_ids, D.shape[1])
+            D, I = D.ravel(), I.ravel()
+        keep = (I >= 0) & (I != q) & (D >= threshold)
+        # k-NN is not symmetric, so a pair may be found from either side; store it as (low, high)
+        rows.append(np.minimum(q[keep], I[keep]))
+        cols.append(np.maximum(q[keep], I[keep]))
+        sims.append(D[keep])
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    pairs, first = np.unique(
+        np.stack([np.concatenate(rows), np.concatenate(cols)], axis=1).astype(np.int64), axis=0, return_index=True
+    )
+    return pairs[:, 0], pairs[:, 1], np.concatenate(sims)[first]
+
+
+def group_pairs(n, rows, cols):
+    """Union-find over accepted pairs; returns each position's root"""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(n)], dtype=np.int64)
+
+
+def canonical_positions(roots, priced):
+    """Pick one representative per group: the first priced member, else the first member"""
+    n = len(roots)
+    positions = np.arange(n)
+    # Sort members by group, priced first, then by position; each group's first row leads it
+    order = np.lexsort((positions, ~priced, roots))
+    sorted_roots = roots[order]
+    starts = np.r_[True, sorted_roots[1:] != sorted_roots[:-1]]
+    leaders = order[np.maximum.accumulate(np.where(starts, positions, 0))]
+    canonical = np.empty(n, dtype=np.int32)
+    canonical[order] = leaders
+    return canonical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect near-duplicate products")
+    parser.add_argument("--vectors", default="models/faiss_index.bin",
+                        help="Catalog vectors: a FAISS index, .npy file or pickled embeddings")
+    parser.add_argument("--meta", default="models/meta.pkl")
+    parser.add_argument("--data", default="data/cleaned_products.csv")
+    parser.add_argument("--out", default="models/duplicates.npy", help="Canonical position per FAISS position")
+    parser.add_argument("--groups", default=None, help="Also write the groups (ids and titles) as JSON")
+    parser.add_argument("--method", choices=["knn", "range"], default="knn")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours checked per product with --method knn")
+    parser.add_argument("--threshold", type=float, default=0.92, help="Minimum embedding cosine similarity")
+    parser.add_argument("--title-threshold", type=float, default=0.5, help="Minimum MinHash title Jaccard")
+    parser.add_argument("--num-perm", type=int, default=64)
+    parser.add_argument("--shingle-size", type=int, default=2, help="Words per title shingle")
+    parser.add_argument("--block-size", type=int, default=4096)
+    parser.add_argument("--nlist", type=int, default=0, help="Use an IVF index with this many lists (0 = exact)")
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    # Paths are relative to the project root, like the app's
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    vectors, _ = load_vectors(args.vectors)
+    ids = load_meta(args.meta)["ids"]
+    if len(ids) != len(vectors):
+        raise SystemExit(f"{args.meta} has {len(ids)} ids but {args.vectors} has {len(vectors)} vectors")
+    rows = pd.read_csv(args.data).drop_duplicates(subset=["uniq_id"]).set_index("uniq_id").reindex(ids)
+    titles = rows["title"].fillna("").astype(str).tolist()
+    priced = (pd.to_numeric(rows["price"], errors="coerce").fillna(0) > 0).to_numpy()
+
+    start = time.perf_counter()
+    i, j, sims = candidate_pairs(
+        vectors, args.threshold, args.method, args.k, args.block_size, args.nlist, args.nprobe
+    )
+    print(f"{len(i)} embedding pairs at cosine >= {args.threshold} ({time.perf_counter() - start:.1f}s)")
+
+    signatures, empty = minhash_signatures(titles, args.num_perm, args.shingle_size)
+    jaccard = (signatures[i] == signatures[j]).mean(axis=1) if len(i) else np.empty(0)
+    accepted = (jaccard >= args.title_threshold) & ~empty[i] & ~empty[j]
+    print(f"{int(accepted.sum())} pairs also match on title (MinHash Jaccard >= {args.title_threshold})")
+
+    roots = group_pairs(len(ids), i[accepted], j[accepted])
+    canonical = canonical_positions(roots, priced)
+    duplicate = canonical != np.arange(len(canonical))
+    num_groups = len(np.unique(canonical[duplicate]))
+    print(f"{num_groups} duplicate groups; {int(duplicate.sum())} of {len(ids)} products collapse onto a canonical one")
+
+    tmp = args.out + ".tmp.npy"
+    np.save(tmp, canonical)
+    os.replace(tmp, args.out)
+    print(f"Wrote {args.out}")
+
+    if args.groups:
+        in_group = np.isin(canonical, canonical[duplicate])
+        groups = pd.Series(np.flatnonzero(in_group)).groupby(canonical[in_group]).apply(list)
+        with open(args.groups, "w", encoding="utf-8") as f:
+            json.dump([
+                {"canonical": ids[c], "members": [{"id": ids[p], "title": titles[p]} for p in members]}
+                for c, members in groups.items()
+            ], f, indent=2)
+        print(f"Wrote {args.groups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 256))
+
+
+def text_key(text, encoder_version):
+    """16-byte digest of the encoder version plus the exact text that gets embedded"""
+    return hashlib.blake2b(f"{encoder_version}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingStore:
+    """Persistent embeddings keyed by a hash of (encoder version, product text).
+
+    On disk it is a directory with a keys file (fixed-width 16-byte digests),
+    a vectors file (float32, memory-mapped on load) and info.json, which names
+    the current pair. Rows whose text and encoder are unchanged hit the store
+    and are never re-encoded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = np.empty(0, dtype="S16")
+        self.vectors = None
+        self._rows = {}
+        info = self._read_info()
+        if info is not None:
+            keys = np.load(os.path.join(path, info["keys"]))
+            vectors = np.load(os.path.join(path, info["vectors"]), mmap_mode="r")
+            if len(keys) == len(vectors) == info["count"]:
+                self.keys, self.vectors = keys, vectors
+                self._rows = {k: i for i, k in enumerate(self.keys.tolist())}
+            else:
+                print(f"Embedding store {path} is inconsistent, ignoring it")
+        print(f"Embedding store {path}: {len(self._rows)} cached vectors")
+
+    def _read_info(self):
+        """info.json of the last completed save, or None if there is none (or it names missing files)"""
+        try:
+            with open(os.path.join(self.path, "info.json")) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not all(os.path.exists(os.path.join(self.path, info.get(name, ""))) for name in ("keys", "vectors")):
+            return None
+        return info
+
+    def lookup(self, keys):
+        """Return the store row for each key, or -1 when it has to be encoded"""
+        return np.array([self._rows.get(k, -1) for k in keys], dtype=np.int64)
+
+    def save(self, keys, vectors, encoder_version):
+        """Replace the store with exactly these entries (stale keys are dropped).
+
+        The new files get fresh names and info.json is swapped in last with a
+        single rename, so a crash leaves either the old store or the new one.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        info = {
+            "encoder_version": encoder_version,
+            "count": len(keys),
+            "keys": f"keys-{generation}.npy",
+            "vectors": f"vectors-{generation}.npy",
+            "saved_at": time.time(),
+        }
+        np.save(os.path.join(self.path, info["keys"]), np.asarray(keys, dtype="S16"))
+        np.save(os.path.join(self.path, info["vectors"]), np.ascontiguousarray(vectors, dtype=np.float32))
+        tmp_info = os.path.join(self.path, "info.tmp.json")
+        with open(tmp_info, "w") as f:
+            json.dump(info, f)
+        os.replace(tmp_info, os.path.join(self.path, "info.json"))
+
+        # Drop earlier generations; one still memory-mapped elsewhere is left for the next save
+        for name in os.listdir(self.path):
+            if name.endswith(".npy") and name not in (info["keys"], info["vectors"]):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+def embed_catalog(df, encoder_name, store_path, encoder_version=None, batch_size=EMBED_BATCH_SIZE):
+    """Embed every catalog row's `text`, re-encoding only rows the store hasn't seen.
+
+    Returns (ids, vectors) in catalog order, ready for build_index and meta.pkl.
+    """
+    encoder_version = encoder_version or encoder_name
+    df = df.drop_duplicates(subset=["uniq_id"])
+    ids = df["uniq_id"].astype(str).tolist()
+    texts = df["text"].fillna("").astype(str).tolist()
+    keys = [text_key(t, encoder_version) for t in texts]
+
+    store = EmbeddingStore(store_path)
+    rows = store.lookup(keys)
+    missing = np.flatnonzero(rows < 0)
+    print(f"{len(keys) - len(missing)} of {len(keys)} rows unchanged, encoding {len(missing)}")
+
+    dim = store.vectors.shape[1] if store.vectors is not None and len(store.vectors) else None
+    fresh = None
+    if len(missing):
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(encoder_name)
+        start = time.perf_counter()
+        fresh = model.encode(
+            [texts[i] for i in missing],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=True,
+        ).astype(np.float32)
+        print(f"Encoded {len(missing)} rows in {time.perf_counter() - start:.1f}s")
+        dim = fresh.shape[1]
+
+    vectors = np.empty((len(keys), dim or 0), dtype=np.float32)
+    hit = rows >= 0
+    if hit.any():
+        # Gather in store order so reads from the memmap stay sequential
+        order = np.argsort(rows[hit])
+        positions = np.flatnonzero(hit)[order]
+        vectors[positions] = store.vectors[rows[hit][order]]
+    if fresh is not None:
+        vectors[missing] = fresh
+
+    # Release the memmap before the files are replaced (required on Windows)
+    store.vectors = None
+    store.save(keys, vectors, encoder_version)
+    return ids, vectors
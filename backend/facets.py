@@ -0,0 +1,205 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pagination import ensure_depth
+from suggest import parse_categories
+
+FACET_DIMENSIONS = ["brand", "category", "cluster", "color", "material", "price_band"]
+# Upper edges of the price bands; prices of 0 or missing fall in "unknown"
+PRICE_BANDS = [float(b) for b in os.environ.get("PRICE_BANDS", "25,50,100,250,500,1000").split(",")]
+FACET_LIMIT = int(os.environ.get("FACET_LIMIT", 10))
+# Search facets count over this many top candidates, not just the returned page
+SEARCH_FACET_DEPTH = int(os.environ.get("SEARCH_FACET_DEPTH", 200))
+# Category paths are cut to this many levels for search facets
+SEARCH_FACET_CATEGORY_LEVEL = int(os.environ.get("SEARCH_FACET_CATEGORY_LEVEL", 2))
+
+CATEGORY_SEP = " > "
+UNKNOWN = "unknown"
+
+
+def price_band_labels(bands=PRICE_BANDS):
+    edges = [0.0] + list(bands)
+    labels = [f"{lo:g}-{hi:g}" for lo, hi in zip(edges, edges[1:])]
+    return labels + [f"{edges[-1]:g}+"]
+
+
+def _labels(series):
+    return series.fillna("").astype(str).str.strip().replace("", UNKNOWN)
+
+
+class FacetEngine:
+    """Columnar group-by cube over the catalog for sliced analytics and search facets.
+
+    Every dimension is dictionary-encoded into an int32 code column, aligned
+    with FAISS positions. At load the products are rolled up into one cell
+    per distinct combination of codes, holding count, priced count and
+    price sum/min/max. Filtered and grouped queries then only touch the
+    cells; search facets count the candidates' codes directly.
+    """
+
+    def __init__(self, df, clustered_df, ids, dimensions=FACET_DIMENSIONS):
+        rows = df.drop_duplicates(subset=["uniq_id"]).set_index("uniq_id").reindex(ids)
+        price = pd.to_numeric(rows["price"], errors="coerce") if "price" in rows.columns else pd.Series(np.nan, index=rows.index)
+        # The catalog uses 0.0 for "no price"
+        price = price.where(price > 0)
+
+        labels = {}
+        for dim in dimensions:
+            if dim == "category":
+                column = rows["categories"] if "categories" in rows.columns else pd.Series(None, index=rows.index)
+                labels[dim] = column.map(lambda v: CATEGORY_SEP.join(parse_categories(v)) or UNKNOWN)
+            elif dim == "cluster":
+                if "cluster" in clustered_df.columns:
+                    cluster = clustered_df.drop_duplicates(subset=["uniq_id"]).set_index("uniq_id")["cluster"].reindex(ids)
+                else:
+                    cluster = pd.Series(np.nan, index=rows.index)
+                labels[dim] = cluster.map(lambda v: UNKNOWN if pd.isna(v) else str(int(v)))
+            elif dim == "price_band":
+                bands = price_band_labels()
+                band = np.searchsorted(PRICE_BANDS, price.to_numpy(), side="right")
+                labels[dim] = pd.Series(
+                    [bands[b] if p == p else UNKNOWN for b, p in zip(band, price.to_numpy())], index=rows.index
+                )
+            else:
+                column = rows[dim] if dim in rows.columns else pd.Series(None, index=rows.index)
+                labels[dim] = _labels(column)
+
+        self.dimensions = list(dimensions)
+        self.codes, self.values, self._lookup = {}, {}, {}
+        for dim in self.dimensions:
+            codes, uniques = pd.factorize(labels[dim].to_numpy())
+            self.codes[dim] = codes.astype(np.int32)
+            self.values[dim] = [str(u) for u in uniques]
+            # Case-insensitive filter lookup; "Black" and "black" are both matched
+            lookup = {}
+            for code, value in enumerate(self.values[dim]):
+                lookup.setdefault(value.lower(), []).append(code)
+            self._lookup[dim] = lookup
+        self.num_products = len(rows)
+
+        # Roll products up into cube cells
+        frame = pd.DataFrame({dim: self.codes[dim] for dim in self.dimensions})
+        frame["price"] = price.to_numpy()
+        cells = frame.groupby(self.dimensions, sort=False).agg(
+            count=("price", "size"),
+            priced=("price", "count"),
+            price_sum=("price", "sum"),
+            price_min=("price", "min"),
+            price_max=("price", "max"),
+        ).reset_index()
+        self.cell_codes = {dim: cells[dim].to_numpy(np.int32) for dim in self.dimensions}
+        self.cell_count = cells["count"].to_numpy(np.float64)
+        self.cell_priced = cells["priced"].to_numpy(np.float64)
+        self.cell_price_sum = cells["price_sum"].to_numpy(np.float64)
+        self.cell_price_min = cells["price_min"].to_numpy(np.float64)
+        self.cell_price_max = cells["price_max"].to_numpy(np.float64)
+
+        # Category path prefixes per level, built on first use
+        self._category_levels = {}
+        print(f"Facet cube built: {self.num_products} products in {len(cells)} cells")
+
+    def _category_level(self, level):
+        """Map full category path codes to the codes of their first `level` levels"""
+        if level not in self._category_levels:
+            prefixes, mapping = {}, []
+            for path in self.values["category"]:
+                prefix = CATEGORY_SEP.join(path.split(CATEGORY_SEP)[:level])
+                mapping.append(prefixes.setdefault(prefix, len(prefixes)))
+            self._category_levels[level] = (np.asarray(mapping, dtype=np.int32), list(prefixes))
+        return self._category_levels[level]
+
+    def _group(self, dim, codes, category_level):
+        """Codes and their labels for grouping `dim`, with category paths cut to `category_level`"""
+        if dim == "category" and category_level:
+            mapping, labels = self._category_level(category_level)
+            return mapping[codes], labels
+        return codes, self.values[dim]
+
+    def _matching_codes(self, dim, values):
+        codes = []
+        for value in values:
+            value = value.strip().lower()
+            codes.extend(self._lookup[dim].get(value, []))
+            if dim == "category":
+                # A category filter also matches every path below it
+                prefix = value + CATEGORY_SEP.lower()
+                codes.extend(c for label, cs in self._lookup[dim].items() if label.startswith(prefix) for c in cs)
+        return np.asarray(codes, dtype=np.int32)
+
+    def _cell_mask(self, filters):
+        mask = np.ones(len(self.cell_count), dtype=bool)
+        for dim, values in (filters or {}).items():
+            if values:
+                mask &= np.isin(self.cell_codes[dim], self._matching_codes(dim, values))
+        return mask
+
+    @staticmethod
+    def _stats(count, priced, price_sum, price_min, price_max):
+        return {
+            "count": int(count),
+            "avg_price": round(price_sum / priced, 2) if priced else None,
+            "min_price": None if price_min != price_min or np.isinf(price_min) else float(price_min),
+            "max_price": None if price_max != price_max or np.isinf(price_max) else float(price_max),
+        }
+
+    def query(self, filters=None, group_by=(), category_level=None, limit=FACET_LIMIT):
+        """Totals for the cells matching `filters` (OR within a dimension, AND across),
+        optionally broken down by up to a few dimensions, largest groups first"""
+        mask = self._cell_mask(filters)
+        count, priced = self.cell_count[mask], self.cell_priced[mask]
+        price_sum, price_min, price_max = self.cell_price_sum[mask], self.cell_price_min[mask], self.cell_price_max[mask]
+        result = {"totals": self._stats(
+            count.sum(), priced.sum(), price_sum.sum(),
+            np.fmin.reduce(price_min, initial=np.inf), np.fmax.reduce(price_max, initial=-np.inf),
+        )}
+        if not group_by:
+            return result
+
+        grouped = [self._group(dim, self.cell_codes[dim][mask], category_level) for dim in group_by]
+        keys = np.stack([codes for codes, _ in grouped], axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n = len(unique)
+        group_count = np.bincount(inverse, weights=count, minlength=n)
+        group_priced = np.bincount(inverse, weights=priced, minlength=n)
+        group_sum = np.bincount(inverse, weights=price_sum, minlength=n)
+        group_min = np.full(n, np.inf)
+        group_max = np.full(n, -np.inf)
+        np.fmin.at(group_min, inverse, price_min)
+        np.fmax.at(group_max, inverse, price_max)
+
+        groups = []
+        for g in np.argsort(-group_count, kind="stable")[:limit]:
+            key = {dim: labels[unique[g, j]] for j, (dim, (_, labels)) in enumerate(zip(group_by, grouped))}
+            groups.append({**key, **self._stats(group_count[g], group_priced[g], group_sum[g], group_min[g], group_max[g])})
+        result["groups"] = groups
+        result["num_groups"] = int(n)
+        return result
+
+    def facet_counts(self, positions, limit=FACET_LIMIT, category_level=SEARCH_FACET_CATEGORY_LEVEL):
+        """Value counts per dimension over a set of FAISS positions (e.g. search candidates)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        facets = {}
+        for dim in self.dimensions:
+            codes, labels = self._group(dim, self.codes[dim][positions], category_level)
+            counts = np.bincount(codes, minlength=len(labels))
+            top = np.argsort(-counts, kind="stable")[:limit]
+            facets[dim] = [{"value": labels[c], "count": int(counts[c])} for c in top if counts[c] > 0]
+        return facets
+
+    def search_facets(self, index, candidates, canonical=None, depth=SEARCH_FACET_DEPTH):
+        """facet_counts over a search's top `depth` candidates.
+
+        The list is deepened first, so every page of a query counts the same
+        candidates however many of them have been served so far.
+        """
+        ensure_depth(index, candidates, depth, canonical)
+        return self.facet_counts(candidates.indices[:depth])
+
+    def nbytes(self):
+        arrays = list(self.codes.values()) + list(self.cell_codes.values()) + [
+            self.cell_count, self.cell_priced, self.cell_price_sum, self.cell_price_min, self.cell_price_max,
+        ]
+        return int(sum(a.nbytes for a in arrays))
@@ -0,0 +1,103 @@
+"""Gunicorn profile for multi-process production serving.
+
+    gunicorn -c backend/gunicorn_conf.py
+
+The app is imported once in the master (preload_app) so the FAISS index,
+product frames and analytics payload are loaded before fork and shared
+copy-on-write between workers. Each worker then pins torch/FAISS to its own
+share of cores so N workers don't oversubscribe the machine. With SHARD_DIR,
+the master starts a single shard server that every worker searches.
+"""
+import multiprocessing
+import os
+import secrets
+import tempfile
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+
+cpu_count = multiprocessing.cpu_count()
+workers = int(os.environ.get("WEB_CONCURRENCY", cpu_count))
+threads_per_worker = int(os.environ.get("THREADS_PER_WORKER", max(1, cpu_count // workers)))
+# Pin each worker to its own slice of cores (Linux only)
+cpu_affinity = os.environ.get("CPU_AFFINITY", "0") == "1"
+
+# Thread pools read these at import time, and the app is imported in the master,
+# so they must be set before preload
+for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(var, str(threads_per_worker))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Sharded serving: one set of shard processes for all workers instead of one per worker,
+# unless SHARD_ADDRESS already points at a running shard_server.py
+shard_dir = os.environ.get("SHARD_DIR")
+start_shard_server = bool(shard_dir) and not os.environ.get("SHARD_ADDRESS")
+if start_shard_server:
+    # Set before preload so the app's ShardedIndex connects to the server
+    os.environ["SHARD_ADDRESS"] = os.path.join(tempfile.gettempdir(), f"faiss-shards-{os.getpid()}.sock")
+    # Shared by the server and the workers through the environment
+    os.environ.setdefault("SHARD_AUTHKEY", secrets.token_hex(32))
+
+pythonpath = backend_dir
+wsgi_app = "app:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"{os.environ.get('API_HOST', '0.0.0.0')}:{os.environ.get('API_PORT', '8000')}"
+preload_app = True
+# Model loading and generation can be slow; don't let the arbiter kill busy workers
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    if start_shard_server:
+        import subprocess
+        import sys
+
+        # Workers wait (in their startup) until it has loaded every shard and is listening
+        server.shard_server = subprocess.Popen([
+            sys.executable, os.path.join(backend_dir, "shard_server.py"),
+            "--shard-dir", shard_dir, "--address", os.environ["SHARD_ADDRESS"],
+        ])
+
+
+def on_exit(server):
+    shard_server = getattr(server, "shard_server", None)
+    if shard_server is not None:
+        shard_server.terminate()
+        shard_server.wait(timeout=10)
+
+
+def free_slot(server):
+    """Lowest worker slot no live worker holds; a respawned worker takes over its predecessor's"""
+    taken = {getattr(w, "slot", None) for w in server.WORKERS.values()}
+    slot = 0
+    while slot in taken:
+        slot += 1
+    return slot
+
+
+def pre_fork(server, worker):
+    # Runs in the master, which knows the live workers; the child inherits the attribute
+    worker.slot = free_slot(server)
+
+    # Move everything loaded so far out of the GC's reach so collections in the
+    # workers don't write to (and un-share) the preloaded pages
+    import gc
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import faiss
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    faiss.omp_set_num_threads(threads_per_worker)
+
+    if cpu_affinity and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        slot = worker.slot % workers
+        mine = cores[slot * threads_per_worker:(slot + 1) * threads_per_worker] or cores
+        os.sched_setaffinity(0, mine)
+        server.log.info(f"Worker {worker.pid} pinned to cores {mine}")
+
+    server.log.info(f"Worker {worker.pid} using {threads_per_worker} torch/FAISS threads")
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from starlette.middleware.gzip import GZipMiddleware
+
+# Browser/CDN freshness for deterministic responses
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", 300))
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+
+
+def artifact_version(paths):
+    """Short fingerprint of the loaded artifacts (path, size, mtime)"""
+    digest = hashlib.sha1()
+    for path in paths:
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def make_etag(version, *parts):
+    """ETag for a response that is fully determined by the artifact version and key.
+
+    Weak, because the compression middleware may send the same JSON gzip-,
+    brotli- or identity-encoded, and a strong ETag must differ per encoding.
+    """
+    key = json.dumps(parts, sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha1(f"{version}|{key}".encode()).hexdigest()[:24] + '"'
+
+
+def _opaque(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _matches(if_none_match, etag):
+    """Weak comparison, as If-None-Match calls for"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or _opaque(candidate) == _opaque(etag):
+            return True
+    return False
+
+
+def cached_response(request, etag, build):
+    """Answer with 304 when the client already has `etag`, else the JSON from build()"""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        # The compression middleware adds Vary only to responses it compresses, never to a 304
+        return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+    return JSONResponse(jsonable_encoder(build()), headers=headers)
+
+
+class CompressionMiddleware:
+    """Negotiated brotli/gzip compression above a size threshold.
+
+    Uses brotli-asgi when it is installed (it falls back to gzip for clients
+    that don't accept br) and Starlette's gzip otherwise. Streaming paths are
+    passed through untouched, since buffering compressors would hold back
+    the chunks.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE, skip_paths=()):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+        try:
+            from brotli_asgi import BrotliMiddleware
+
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        except ImportError:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in self.skip_paths:
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,229 @@
+import os
+from collections import Counter
+
+import numpy as np
+
+from pagination import MAX_CANDIDATES, Candidates, search_candidates
+from rerank import tokenize
+
+# Candidates taken from each side before hybrid fusion
+HYBRID_DEPTH = int(os.environ.get("HYBRID_DEPTH", 100))
+# Reciprocal-rank-fusion constant; larger values flatten the contribution of top ranks
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+LEXICAL_FIELDS = ["title", "brand", "description", "text"]
+
+
+class BM25Index:
+    """In-process BM25 inverted index with compact CSR posting lists.
+
+    Documents are numbered by their position in the FAISS index so lexical
+    and vector hits share ids. Each term's postings are a slice of flat
+    arrays (int32 doc ids, float32 BM25 impacts precomputed at build time),
+    kept twice: in doc order for random access and in impact order for
+    top-k pruning. A query walks the impact-ordered prefixes of its terms
+    and stops reading once no unseen document can reach the current top k,
+    instead of scoring every posting of every term.
+    """
+
+    def __init__(self, df, ids, fields=LEXICAL_FIELDS, k1=1.2, b=0.75):
+        rows = df.drop_duplicates(subset=["uniq_id"]).set_index("uniq_id").reindex(ids)
+        fields = [f for f in fields if f in rows.columns]
+        text = rows[fields].fillna("").astype(str).agg(" ".join, axis=1)
+
+        doc_terms = [Counter(tokenize(t)) for t in text]
+        lengths = np.array([sum(c.values()) for c in doc_terms], dtype=np.float32)
+        avg_len = float(lengths.mean()) if len(lengths) else 0.0
+        num_docs = len(doc_terms)
+
+        # Gather (term, doc, tf) triples
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        for doc, counts in enumerate(doc_terms):
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc)
+                tfs.append(tf)
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+
+        doc_freq = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+        idf = np.log1p((num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(avg_len, 1e-9))
+        impacts = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        self._layout(vocab, num_docs, term_ids, doc_ids, impacts)
+        print(f"BM25 index built: {self.num_docs} docs, {len(self.vocab)} terms, {len(self.doc_ids)} postings")
+
+    @classmethod
+    def from_postings(cls, vocab, num_docs, term_ids, doc_ids, impacts):
+        """Build directly from (term, doc, impact) postings, e.g. for benchmarks"""
+        index = cls.__new__(cls)
+        index._layout(vocab, num_docs, term_ids, doc_ids, impacts)
+        return index
+
+    def _layout(self, vocab, num_docs, term_ids, doc_ids, impacts):
+        self.vocab = vocab
+        self.num_docs = num_docs
+        # Doc order within each term, for membership lookups with searchsorted
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids = np.asarray(term_ids)[order]
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.impacts = np.asarray(impacts, dtype=np.float32)[order]
+        self.offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=self.offsets[1:])
+        # Impact order within each term, for the pruned top-k walk
+        by_impact = np.lexsort((-self.impacts, term_ids))
+        self.impact_doc_ids = self.doc_ids[by_impact]
+        self.impact_scores = self.impacts[by_impact]
+
+    def nbytes(self):
+        return int(
+            self.doc_ids.nbytes + self.impacts.nbytes + self.offsets.nbytes
+            + self.impact_doc_ids.nbytes + self.impact_scores.nbytes
+        )
+
+    def search(self, query, k):
+        """Return (doc positions, scores) for the top-k BM25 matches, best first.
+
+        Fewer than k results means every matching document was returned.
+        """
+        spans = []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                spans.append((int(self.offsets[term_id]), int(self.offsets[term_id + 1])))
+        if not spans or k <= 0:
+            return [], []
+
+        if len(spans) == 1:
+            start, end = spans[0]
+            end = min(end, start + k)
+            return self.impact_doc_ids[start:end].tolist(), self.impact_scores[start:end].astype(float).tolist()
+
+        if len(spans) > 64:
+            # Too many terms for the per-document bitmask; score every posting
+            docs, inverse = np.unique(np.concatenate([self.doc_ids[s:e] for s, e in spans]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([self.impacts[s:e] for s, e in spans]))
+            n = min(k, len(docs))
+            top = np.argpartition(-scores, n - 1)[:n]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return docs[top].tolist(), scores[top].tolist()
+
+        # Threshold algorithm over the impact-ordered postings: read each term's
+        # list a block at a time into an accumulator over just the documents
+        # read so far (see _accumulate), so a selective query doesn't pay for
+        # the whole catalog. Postings not read yet are worth at most the term's
+        # next impact (its `bound`), so once the kth best partial score reaches
+        # the sum of the bounds no unseen document can enter the top k, and only
+        # documents whose upper bound still reaches it need their missing terms
+        # looked up.
+        mask_type = np.min_scalar_type(1 << (len(spans) - 1))
+        # Sorted ids of the documents read so far, their partial scores, and
+        # bit t set once a document has been read from term t's list
+        docs = np.empty(0, dtype=self.impact_doc_ids.dtype)
+        scores = np.empty(0, dtype=np.float32)
+        seen = np.empty(0, dtype=mask_type)
+        read = [s for s, _ in spans]
+        depth = max(4 * k, 1024)
+        while True:
+            blocks = [(docs, scores, seen)]
+            for t, (s, e) in enumerate(spans):
+                stop = min(e, s + depth)
+                blocks.append((
+                    self.impact_doc_ids[read[t]:stop],
+                    self.impact_scores[read[t]:stop],
+                    np.full(stop - read[t], 1 << t, dtype=mask_type),
+                ))
+                read[t] = stop
+            docs, scores, seen = self._accumulate(blocks)
+
+            bounds = [float(self.impact_scores[p]) if p < e else 0.0 for p, (_, e) in zip(read, spans)]
+            partial = scores
+            n = min(k, len(docs))
+            threshold = np.partition(partial, len(partial) - n)[len(partial) - n]
+            if not any(bounds) or (n == k and sum(bounds) <= threshold):
+                break
+            depth *= 4
+
+        if any(bounds):
+            missing = np.zeros(len(docs), dtype=np.float32)
+            for t, bound in enumerate(bounds):
+                missing += np.where(seen & (1 << t), 0.0, bound).astype(np.float32)
+            keep = partial + missing >= threshold
+            docs, seen, exact = docs[keep], seen[keep], partial[keep]
+            for t, ((s, e), bound) in enumerate(zip(spans, bounds)):
+                unread = (seen & (1 << t)) == 0
+                if not bound or not unread.any():
+                    continue
+                postings = self.doc_ids[s:e]
+                lookup = docs[unread]
+                pos = np.minimum(np.searchsorted(postings, lookup), len(postings) - 1)
+                found = postings[pos] == lookup
+                exact[np.flatnonzero(unread)[found]] += self.impacts[s + pos[found]]
+            partial = exact
+        n = min(k, len(docs))
+        top = np.argpartition(-partial, n - 1)[:n]
+        top = top[np.argsort(-partial[top], kind="stable")]
+        return docs[top].tolist(), partial[top].astype(float).tolist()
+
+
+    def _accumulate(self, blocks):
+        """Merge (doc ids, scores, term bits) blocks into sorted unique docs with summed scores and OR-ed bits.
+
+        Doc ids are unique within each block. Small merges sort the postings
+        read; once they approach the catalog size a dense scatter is cheaper.
+        """
+        merged = np.concatenate([b[0] for b in blocks])
+        if len(merged) >= self.num_docs // 2:
+            scores = np.zeros(self.num_docs, dtype=np.float32)
+            seen = np.zeros(self.num_docs, dtype=blocks[0][2].dtype)
+            for docs, block_scores, bits in blocks:
+                scores[docs] += block_scores
+                seen[docs] |= bits
+            docs = np.flatnonzero(seen).astype(merged.dtype)
+            return docs, scores[docs], seen[docs]
+        order = np.argsort(merged)
+        merged = merged[order]
+        starts = np.flatnonzero(np.concatenate(([True], merged[1:] != merged[:-1])))
+        scores = np.add.reduceat(np.concatenate([b[1] for b in blocks])[order], starts)
+        seen = np.bitwise_or.reduceat(np.concatenate([b[2] for b in blocks])[order], starts)
+        return merged[starts], scores, seen
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuse several ranked lists of doc positions; returns (positions, fused scores)"""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])
+    return [doc for doc, _ in ordered], [score for _, score in ordered]
+
+
+def lexical_candidates(lexical_index, text, depth):
+    """BM25 candidates; extending the list re-runs the query deeper"""
+    depth = max(1, min(depth, MAX_CANDIDATES))
+    hits, scores = lexical_index.search(text, depth)
+    return Candidates(
+        None, hits, scores,
+        # A short list means BM25 returned every match
+        exhausted=len(hits) < depth or depth >= MAX_CANDIDATES,
+        higher_is_better=True,
+        fetch=lambda k: lexical_candidates(lexical_index, text, k),
+    )
+
+
+def hybrid_candidates(index, lexical_index, text, embedding, depth):
+    """Vector and lexical lists of the same depth fused with reciprocal rank fusion"""
+    fuse_depth = min(max(depth, HYBRID_DEPTH), MAX_CANDIDATES)
+    vector = search_candidates(index, embedding, fuse_depth)
+    lexical = lexical_candidates(lexical_index, text, fuse_depth)
+    hits, scores = reciprocal_rank_fusion(vector.indices, lexical.indices)
+    return Candidates(
+        embedding, hits, scores,
+        exhausted=vector.exhausted and lexical.exhausted,
+        higher_is_better=True,
+        degraded=vector.degraded,
+        fetch=lambda k: hybrid_candidates(index, lexical_index, text, embedding, k),
+    )
@@ -0,0 +1,233 @@
+import gc
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from sharding import ShardedIndex
+
+# Resident-set budget for the whole worker process (0 = no limit)
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", 0))
+# Budget for the request caches combined, by estimated size (0 = no limit)
+CACHE_BUDGET_MB = float(os.environ.get("CACHE_BUDGET_MB", 0))
+MEMORY_CHECK_SECONDS = float(os.environ.get("MEMORY_CHECK_SECONDS", 10))
+# Entries sampled per cache to estimate its size
+CACHE_SIZE_SAMPLE = 32
+
+
+class MemoryBudgetError(RuntimeError):
+    """Raised when loading an artifact would take the process over MEMORY_BUDGET_MB"""
+
+
+def process_rss():
+    """Current resident set size in bytes (psutil, /proc, or peak RSS as a last resort)"""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def index_nbytes(index):
+    """Bytes of vector codes held by a FAISS index (or one of the app's index wrappers)"""
+    if isinstance(index, ShardedIndex):
+        # The vectors live in the shard processes
+        return 0
+    inner = getattr(index, "index", index)
+    code_size = getattr(inner, "code_size", inner.d * 4)
+    return int(inner.ntotal * code_size)
+
+
+def model_nbytes(model):
+    """Parameter and buffer bytes of a torch module (SentenceTransformer included)"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return int(sum(t.numel() * t.element_size() for t in tensors))
+
+
+def object_nbytes(obj, _seen=None):
+    """Rough deep size of plain Python containers, strings and numpy arrays"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + sys.getsizeof(np.empty(0))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(object_nbytes(k, seen) + object_nbytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(object_nbytes(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += object_nbytes(vars(obj), seen)
+    return size
+
+
+def sampled_nbytes(cache):
+    """Estimate a cache's size from a sample of its entries"""
+    count = len(cache)
+    if not count:
+        return 0
+    sample = cache.sample(CACHE_SIZE_SAMPLE)
+    if not sample:
+        return 0
+    return int(count * sum(object_nbytes(v) for v in sample) / len(sample))
+
+
+class MemoryMonitor:
+    """Per-component memory accounting with budget enforcement.
+
+    Components report their size through callables returning {name: bytes};
+    static ones (models, catalogs) compute it once at load. Caches are
+    estimated from samples and can be trimmed. A background check trims
+    caches past CACHE_BUDGET_MB, and when the process is past
+    MEMORY_BUDGET_MB it trims caches and then evicts unpinned catalogs.
+    Loads that would not fit are refused up front with MemoryBudgetError.
+    """
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, cache_budget_mb=CACHE_BUDGET_MB, interval=MEMORY_CHECK_SECONDS):
+        self.budget = int(budget_mb * 2**20)
+        self.cache_budget = int(cache_budget_mb * 2**20)
+        self.interval = interval
+        self._components = []
+        self._cache_sources = []
+        self._evictors = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self.stats = {"checks": 0, "cache_trims": 0, "catalog_evictions": 0, "refused_loads": 0}
+
+    def add_components(self, sizer):
+        self._components.append(sizer)
+
+    def add_caches(self, source):
+        """Track caches returned by `source()` as {name: cache}; each exposes __len__, sample(n) and trim(fraction)"""
+        self._cache_sources.append(source)
+
+    def caches(self):
+        caches = {}
+        for source in self._cache_sources:
+            caches.update(source())
+        return caches
+
+    def add_evictor(self, evict):
+        """Register a callable that frees one evictable artifact and returns whether it did"""
+        self._evictors.append(evict)
+
+    def components(self):
+        sizes = {}
+        for sizer in self._components:
+            sizes.update(sizer())
+        return sizes
+
+    def cache_sizes(self):
+        return {name: sampled_nbytes(cache) for name, cache in self.caches().items()}
+
+    def snapshot(self):
+        components = self.components()
+        caches = self.caches()
+        cache_bytes = {name: sampled_nbytes(cache) for name, cache in caches.items()}
+        return {
+            "rss_bytes": process_rss(),
+            "components": components,
+            "caches": {name: {"bytes": cache_bytes[name], "entries": len(cache)} for name, cache in caches.items()},
+            "tracked_bytes": sum(components.values()) + sum(cache_bytes.values()),
+            "budget_bytes": self.budget or None,
+            "cache_budget_bytes": self.cache_budget or None,
+            **self.stats,
+        }
+
+    def _trim_caches(self, fraction=0.5):
+        trimmed = False
+        for cache in self.caches().values():
+            if len(cache):
+                cache.trim(fraction)
+                trimmed = True
+        if trimmed:
+            self.stats["cache_trims"] += 1
+        return trimmed
+
+    def enforce(self):
+        """One budget check: trim caches, then evict catalogs, until back under budget"""
+        with self._lock:
+            self.stats["checks"] += 1
+            if self.cache_budget:
+                while sum(self.cache_sizes().values()) > self.cache_budget and self._trim_caches():
+                    pass
+            if self.budget and process_rss() > self.budget:
+                print(f"RSS {process_rss() / 2**20:.0f} MB over MEMORY_BUDGET_MB; trimming caches")
+                self._trim_caches(1.0)
+                gc.collect()
+                while process_rss() > self.budget and any(evict() for evict in self._evictors):
+                    self.stats["catalog_evictions"] += 1
+                    gc.collect()
+
+    def admit(self, name, estimate):
+        """Make room for an artifact of about `estimate` bytes, or raise MemoryBudgetError"""
+        if not self.budget or process_rss() + estimate <= self.budget:
+            return
+        with self._lock:
+            self._trim_caches(1.0)
+            gc.collect()
+            while process_rss() + estimate > self.budget and any(evict() for evict in self._evictors):
+                self.stats["catalog_evictions"] += 1
+                gc.collect()
+            if process_rss() + estimate > self.budget:
+                self.stats["refused_loads"] += 1
+                raise MemoryBudgetError(
+                    f"Loading {name} (~{estimate / 2**20:.0f} MB) would exceed MEMORY_BUDGET_MB "
+                    f"({self.budget / 2**20:.0f} MB, RSS {process_rss() / 2**20:.0f} MB)"
+                )
+
+    def start(self):
+        """Run enforce() periodically in this process (once per worker)"""
+        if not (self.budget or self.cache_budget) or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.enforce()
+                except Exception as e:
+                    print(f"Memory check failed: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def prometheus(self):
+        """The snapshot in Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = [
+            "# TYPE app_process_rss_bytes gauge",
+            f"app_process_rss_bytes {snap['rss_bytes']}",
+            "# TYPE app_component_bytes gauge",
+        ]
+        lines += [f'app_component_bytes{{component="{name}"}} {size}' for name, size in snap["components"].items()]
+        lines.append("# TYPE app_cache_bytes gauge")
+        lines += [f'app_cache_bytes{{cache="{name}"}} {c["bytes"]}' for name, c in snap["caches"].items()]
+        lines.append("# TYPE app_cache_entries gauge")
+        lines += [f'app_cache_entries{{cache="{name}"}} {c["entries"]}' for name, c in snap["caches"].items()]
+        lines += [
+            "# TYPE app_memory_budget_bytes gauge",
+            f"app_memory_budget_bytes {self.budget}",
+            "# TYPE app_cache_budget_bytes gauge",
+            f"app_cache_budget_bytes {self.cache_budget}",
+        ]
+        for key in ("cache_trims", "catalog_evictions", "refused_loads"):
+            lines += [f"# TYPE app_memory_{key}_total counter", f"app_memory_{key}_total {self.stats[key]}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from chat import LRUCache
+
+# Limits that protect the FAISS index from huge k values
+MAX_TOP_K = int(os.environ.get("MAX_TOP_K", 50))
+MAX_CANDIDATES = int(os.environ.get("MAX_CANDIDATES", 1000))
+
+# Cursor cache bounds: entries expire after the TTL and the oldest are evicted
+# once the cache is full, so memory stays at most CURSOR_CACHE_SIZE * MAX_CANDIDATES ids
+CURSOR_TTL_SECONDS = float(os.environ.get("CURSOR_TTL_SECONDS", 300))
+CURSOR_CACHE_SIZE = int(os.environ.get("CURSOR_CACHE_SIZE", 1024))
+
+
+class CursorError(ValueError):
+    """Raised when a pagination cursor cannot be parsed"""
+
+
+class Candidates:
+    """Ranked FAISS hits for one query plus the embedding used to extend them"""
+
+    def __init__(self, embedding, indices, distances, exhausted, higher_is_better=None, fetch=None, degraded=False):
+        self.embedding = embedding
+        self.indices = list(indices)
+        self.distances = list(distances)
+        # True once the index has no more hits to give for this embedding
+        self.exhausted = exhausted
+        # Score direction for non-FAISS lists (BM25, fused); None means the index metric
+        self.higher_is_better = higher_is_better
+        # fetch(k) -> Candidates re-runs a non-FAISS query k deep; None extends with a FAISS search
+        self.fetch = fetch
+        # True when some index shards missed the deadline; such lists are never cached
+        self.degraded = degraded
+        # query_key() of the request that built the list; cursors must present the same one
+        self.query_key = None
+        # Held while a request deepens the list; cached lists are shared by concurrent pages
+        self.lock = threading.Lock()
+
+
+class CandidateCache(LRUCache):
+    """Bounded, TTL-evicted store of candidate lists keyed by cursor token"""
+
+    def __init__(self, max_entries=CURSOR_CACHE_SIZE, ttl=CURSOR_TTL_SECONDS):
+        super().__init__(max_entries, ttl)
+
+    def add(self, candidates):
+        """Cache a candidate list under a new cursor token and return the token"""
+        token = new_token()
+        self.put(token, candidates)
+        return token
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def query_key(*parts):
+    """Short fingerprint of what a candidate list answers (query text, mode, rerank, catalog)"""
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:12]
+
+
+def encode_cursor(token, key, offset):
+    return f"{token}.{key}.{offset}"
+
+
+def decode_cursor(cursor):
+    """Split a cursor into (token, query key, offset)"""
+    parts = cursor.split(".")
+    if len(parts) != 3 or not all(parts) or not parts[2].isdigit():
+        raise CursorError(f"Invalid cursor: {cursor}")
+    return parts[0], parts[1], int(parts[2])
+
+
+def search_candidates(index, embedding, k):
+    """Run one FAISS search and return Candidates with padding (-1) hits dropped"""
+    k = max(1, min(k, MAX_CANDIDATES, index.ntotal))
+    if hasattr(index, "search_with_status"):
+        # Sharded: a shard that missed the deadline leaves the list short but not complete
+        D, I, complete = index.search_with_status(embedding.reshape(1, -1), k)
+    else:
+        (D, I), complete = index.search(embedding.reshape(1, -1), k), True
+    hits = [(int(i), float(d)) for i, d in zip(I[0], D[0]) if i >= 0]
+    exhausted = complete and (len(hits) < k or k >= min(MAX_CANDIDATES, index.ntotal))
+    return Candidates(
+        embedding,
+        [i for i, _ in hits],
+        [d for _, d in hits],
+        exhausted,
+        degraded=not complete,
+    )
+
+
+def group_of(canonical, i):
+    """Near-duplicate group of FAISS position i: its canonical position, or i itself without a mapping"""
+    return int(canonical[i]) if canonical is not None else int(i)
+
+
+def collapse_duplicates(candidates, canonical):
+    """Keep only the best-ranked hit of each near-duplicate group, in place.
+
+    `canonical` maps every FAISS position to its group's canonical position
+    (see dedupe.py); None leaves the list untouched.
+    """
+    if canonical is None:
+        return candidates
+    seen = set()
+    indices, distances = [], []
+    for i, d in zip(candidates.indices, candidates.distances):
+        group = group_of(canonical, i)
+        if group not in seen:
+            seen.add(group)
+            indices.append(i)
+            distances.append(d)
+    candidates.indices, candidates.distances = indices, distances
+    return candidates
+
+
+def ensure_depth(index, candidates, depth, canonical=None):
+    """Deepen the candidate list in place so it covers `depth` hits when possible.
+
+    Concurrent callers deepen a shared list one at a time, so none of them
+    appends hits another has already added.
+    """
+    with candidates.lock:
+        searched = len(candidates.indices)
+        while depth > len(candidates.indices) and not candidates.exhausted:
+            # Grow geometrically so successive pages don't each trigger a search; base it on
+            # the depth already searched, since collapsed duplicates don't lengthen the list
+            searched = k = max(depth, 2 * searched)
+            if candidates.fetch is not None:
+                deeper = candidates.fetch(k)
+            else:
+                deeper = search_candidates(index, candidates.embedding, k)
+            if deeper.degraded and not candidates.degraded:
+                # Don't splice a partial answer into a complete (possibly cached) list; a later page retries
+                break
+            # Keep the existing prefix as-is (it may have been re-ranked) and append only
+            # new hits, skipping duplicates of products already in the list
+            seen = {group_of(canonical, i) for i in candidates.indices}
+            for i, d in zip(deeper.indices, deeper.distances):
+                group = group_of(canonical, i)
+                if group not in seen:
+                    seen.add(group)
+                    candidates.indices.append(i)
+                    candidates.distances.append(d)
+            candidates.exhausted = deeper.exhausted
+            if deeper.degraded:
+                # Shards are missing the deadline: serve the short page (its cursor searches again)
+                # instead of fanning out to the same overloaded shards in a loop
+                break
+    return candidates
@@ -0,0 +1,299 @@
+import contextvars
+import io
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 2))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+
+# The capture for the current request; contextvars follow the request into threadpool threads
+_request_profile = contextvars.ContextVar("request_profile", default=None)
+# A /admin/profile window records every request that runs while it is open
+_window_profile = None
+
+# Threads whose innermost frame is in one of these modules are parked, not working
+_IDLE_FILES = {"threading.py", "queue.py", "selectors.py", "socket.py", "ssl.py", "base_events.py"}
+
+
+class StackSampler:
+    """Sampling profiler over all threads.
+
+    A daemon thread grabs sys._current_frames() every interval and counts
+    collapsed stacks. Sync FastAPI endpoints run in threadpool threads, so a
+    per-thread profiler started in middleware would miss them; sampling
+    every thread catches the work wherever it runs. Idle threads are skipped.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+        # Thread ids never sampled (e.g. a thread that only sleeps through a window)
+        self.exclude = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or thread_id in self.exclude or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        """Collapsed stacks, the input format of flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def call_tree(self, limit=40):
+        """Top functions by inclusive and self samples"""
+        total, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            for frame in set(frames):
+                total[frame] += count
+            own[frames[-1]] += count
+        busy = sum(self.stacks.values()) or 1
+        lines = [f"{'total%':>7} {'self%':>7}  function"]
+        for frame, count in total.most_common(limit):
+            lines.append(f"{100 * count / busy:>6.1f}% {100 * own[frame] / busy:>6.1f}%  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+class Profile:
+    """One profiling capture: stack samples plus torch op timings, saved as a zip.
+
+    torch.profiler only records the thread that enters it, and model calls
+    run in threadpool or generation threads rather than where the capture
+    starts. Model call sites therefore wrap themselves in torch_ops(), which
+    profiles that call on its own thread and adds its ops to this capture.
+    """
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.sampler = StackSampler()
+        self.started = None
+        # op name -> [calls, self CPU us, total CPU us], summed over the recorded model calls
+        self.torch_ops = {}
+        self.torch_calls = 0
+        self.torch_skipped = 0
+        self.torch_error = None
+        self._torch_lock = threading.Lock()
+        self._torch_owner = None
+
+    def __enter__(self):
+        self.started = time.time()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.sampler.stop()
+        self._save(self.torch_table(), time.time() - self.started)
+        return False
+
+    @contextmanager
+    def torch_section(self):
+        """Run torch.profiler around the block on the calling thread"""
+        if self._torch_owner == threading.get_ident():
+            # Nested model call on a thread that is already recording
+            yield
+            return
+        if not self._torch_lock.acquire(blocking=False):
+            # torch.profiler can't record two threads at once; overlapping calls go unrecorded
+            self.torch_skipped += 1
+            yield
+            return
+        self._torch_owner = threading.get_ident()
+        try:
+            try:
+                import torch
+
+                profiler = torch.profiler.profile(
+                    activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True
+                )
+                profiler.__enter__()
+            except Exception as e:
+                self.torch_error = f"torch profiler not available: {e}"
+                profiler = None
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    try:
+                        profiler.__exit__(None, None, None)
+                        self._add_ops(profiler.key_averages())
+                    except Exception:
+                        self.torch_error = traceback.format_exc()
+        finally:
+            self._torch_owner = None
+            self._torch_lock.release()
+
+    def _add_ops(self, averages):
+        self.torch_calls += 1
+        for event in averages:
+            op = self.torch_ops.setdefault(event.key, [0, 0.0, 0.0])
+            op[0] += event.count
+            op[1] += event.self_cpu_time_total
+            op[2] += event.cpu_time_total
+
+    def torch_table(self, limit=40):
+        """Op-level CPU times over every recorded model call, by self time"""
+        if not self.torch_ops:
+            return (self.torch_error or "No model calls ran during the capture") + "\n"
+        lines = [f"{'self ms':>10} {'total ms':>10} {'calls':>8}  op"]
+        ops = sorted(self.torch_ops.items(), key=lambda item: -item[1][1])
+        for name, (calls, self_us, total_us) in ops[:limit]:
+            lines.append(f"{self_us / 1000:>10.2f} {total_us / 1000:>10.2f} {calls:>8}  {name}")
+        lines.append(f"\n{self.torch_calls} model calls recorded, {self.torch_skipped} overlapping calls not recorded")
+        return "\n".join(lines) + "\n"
+
+    def _save(self, torch_table, duration):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("summary.json", json.dumps({
+                "id": self.id,
+                "label": self.label,
+                "started": self.started,
+                "duration_s": round(duration, 4),
+                "samples": self.sampler.samples,
+                "interval_ms": self.sampler.interval * 1000,
+                "torch_calls": self.torch_calls,
+                "torch_calls_skipped": self.torch_skipped,
+            }, indent=2))
+            archive.writestr("stacks.folded", self.sampler.folded())
+            archive.writestr("calltree.txt", self.sampler.call_tree())
+            archive.writestr("torch_ops.txt", torch_table)
+        tmp = artifact_path(self.id) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp, artifact_path(self.id))
+        _prune()
+
+
+def artifact_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"profile-{profile_id}.zip")
+
+
+def _prune():
+    files = sorted(
+        (os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".zip")),
+        key=os.path.getmtime,
+    )
+    for path in files[:-PROFILE_KEEP]:
+        os.remove(path)
+
+
+# Only one capture at a time: overlapping torch profilers are not supported
+profile_lock = threading.Lock()
+
+
+def current_profile():
+    return _request_profile.get() or _window_profile
+
+
+@contextmanager
+def torch_ops(profile=None):
+    """Record the torch ops of the model call inside the block into the active capture.
+
+    Pass `profile` when the call runs on a thread started outside the
+    request's context (e.g. a generation thread); it defaults to the
+    request's capture or the open window. Without a capture this is a
+    contextvar lookup.
+    """
+    profile = profile or current_profile()
+    if profile is None:
+        yield
+        return
+    with profile.torch_section():
+        yield
+
+
+def profile_window(seconds):
+    """Start a background capture of everything the process does for `seconds`"""
+    if not profile_lock.acquire(blocking=False):
+        return None
+    profile = Profile(f"window {seconds:g}s")
+
+    def run():
+        global _window_profile
+        profile.sampler.exclude.add(threading.get_ident())
+        try:
+            with profile:
+                _window_profile = profile
+                try:
+                    time.sleep(seconds)
+                finally:
+                    _window_profile = None
+        finally:
+            profile_lock.release()
+
+    threading.Thread(target=run, daemon=True).start()
+    return profile.id
+
+
+class ProfileMiddleware:
+    """Profile a single request when it carries X-Profile and a valid admin token.
+
+    Requests without the X-Profile header go straight through; the only cost
+    is one header scan. The artifact id comes back in X-Profile-Id.
+    """
+
+    def __init__(self, app, is_admin):
+        self.app = app
+        self.is_admin = is_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if b"x-profile" not in headers or not self.is_admin(headers.get(b"x-admin-token", b"").decode()):
+            await self.app(scope, receive, send)
+            return
+        if not profile_lock.acquire(blocking=False):
+            # Another capture is running; serve the request unprofiled
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(f"{scope['method']} {scope['path']}")
+
+        async def tagged_send(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _request_profile.set(profile)
+        try:
+            with profile:
+                await self.app(scope, receive, tagged_send)
+        finally:
+            _request_profile.reset(token)
+            profile_lock.release()
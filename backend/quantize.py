@@ -0,0 +1,113 @@
+import os
+
+import faiss
+import numpy as np
+
+# Storage precisions the build tool and loader understand
+PRECISIONS = ["fp32", "fp16", "sq8", "pq"]
+
+# Exact re-ranking: how many quantized hits to re-score per requested result
+EXACT_RERANK_FACTOR = int(os.environ.get("EXACT_RERANK_FACTOR", 4))
+
+
+def build_index(vectors, precision="fp32", metric=faiss.METRIC_INNER_PRODUCT, pq_m=None, pq_bits=8):
+    """Build a FAISS index over float32 vectors at the requested storage precision"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    d = vectors.shape[1]
+    if precision == "fp32":
+        index = faiss.IndexFlat(d, metric)
+    elif precision == "fp16":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, metric)
+    elif precision == "sq8":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, metric)
+    elif precision == "pq":
+        # Sub-quantizer count must divide d; default to 8 dims per code byte
+        pq_m = pq_m or max(1, d // 8)
+        index = faiss.IndexPQ(d, pq_m, pq_bits, metric)
+    else:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {PRECISIONS})")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def index_footprint(index):
+    """(bytes per stored vector, fixed bytes) of an index.
+
+    The fixed part - header, trained scalar-quantizer ranges, PQ codebooks -
+    does not grow with the catalog, so it is reported apart from the
+    per-vector codes rather than spread over however many vectors were added.
+    """
+    code_size = getattr(index, "code_size", index.d * 4)
+    fixed = len(faiss.serialize_index(index)) - code_size * index.ntotal
+    return code_size, max(0, fixed)
+
+
+class ExactRerankIndex:
+    """Quantized FAISS index with exact re-scoring from a float32 memmap.
+
+    Searches over-fetch `factor * k` hits from the compact index, then
+    re-score just those rows against the original float32 vectors, which
+    are memory-mapped so only the touched pages are resident. Exposes the
+    subset of the FAISS index API the app uses.
+    """
+
+    def __init__(self, index, vectors, factor=EXACT_RERANK_FACTOR):
+        if len(vectors) != index.ntotal:
+            raise ValueError(f"Vector store has {len(vectors)} rows but index has {index.ntotal}")
+        self.index = index
+        self.vectors = vectors
+        self.factor = factor
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        return self.index.d
+
+    @property
+    def metric_type(self):
+        return self.index.metric_type
+
+    def reconstruct(self, i):
+        return np.array(self.vectors[i], dtype=np.float32)
+
+    def reconstruct_batch(self, ids):
+        return np.asarray(self.vectors[np.asarray(ids)], dtype=np.float32)
+
+    def search(self, x, k):
+        x = np.asarray(x, dtype=np.float32).reshape(-1, self.d)
+        _, I = self.index.search(x, min(k * self.factor, self.ntotal))
+        D_out = np.full((len(x), k), np.nan, dtype=np.float32)
+        I_out = np.full((len(x), k), -1, dtype=np.int64)
+        higher_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        for row, (q, ids) in enumerate(zip(x, I)):
+            # Sorted ids keep the memmap reads sequential
+            ids = np.sort(ids[ids >= 0])
+            vecs = self.reconstruct_batch(ids)
+            if higher_is_better:
+                scores = vecs @ q
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((vecs - q) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:k]
+            D_out[row, :len(order)] = scores[order]
+            I_out[row, :len(order)] = ids[order]
+        return D_out, I_out
+
+
+def load_index(path, exact_vectors_path=None, mmap=False):
+    """Read an index, optionally wrapping it for exact re-ranking from a .npy memmap"""
+    if mmap:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    else:
+        index = faiss.read_index(path)
+    if exact_vectors_path and os.path.exists(exact_vectors_path):
+        vectors = np.load(exact_vectors_path, mmap_mode="r")
+        print(f"Exact re-ranking enabled from {exact_vectors_path}")
+        return ExactRerankIndex(index, vectors)
+    return index
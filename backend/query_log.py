@@ -0,0 +1,137 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+# Opt-in: nothing is captured unless QUERY_LOG_PATH is set
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH", "")
+QUERY_LOG_SAMPLE = float(os.environ.get("QUERY_LOG_SAMPLE", 0.01))
+QUERY_LOG_MAX_BYTES = int(os.environ.get("QUERY_LOG_MAX_BYTES", 64 * 1024 * 1024))
+QUERY_LOG_BACKUPS = int(os.environ.get("QUERY_LOG_BACKUPS", 5))
+
+CAPTURED_PATHS = (
+    "/recommend",
+    "/search-products",
+    "/recommend-by-id",
+    "/recommend-by-session",
+    "/generate-description",
+    "/suggest",
+    "/chat",
+)
+
+
+class QueryLogWriter:
+    """Background NDJSON writer with size-based rotation.
+
+    Records go through a bounded queue; when the writer falls behind they
+    are dropped (and counted) rather than slowing requests down.
+    """
+
+    def __init__(self, path, max_bytes=QUERY_LOG_MAX_BYTES, backups=QUERY_LOG_BACKUPS, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.stats = {"written": 0, "dropped": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # One writer thread and file per process, so gunicorn workers never share a file
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                root, ext = os.path.splitext(self.path)
+                self._file_path = f"{root}-{os.getpid()}{ext}"
+                threading.Thread(target=self._run, daemon=True).start()
+                self._pid = os.getpid()
+
+    def write(self, record):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self._file_path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self._file_path}.{i + 1}")
+        os.replace(self._file_path, f"{self._file_path}.1")
+
+    def _run(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self._file_path)), exist_ok=True)
+        f = open(self._file_path, "a", encoding="utf-8")
+        while True:
+            record = self._queue.get()
+            f.write(json.dumps(record, default=str) + "\n")
+            self.stats["written"] += 1
+            # Flush in batches: only when the queue has drained
+            if self._queue.empty():
+                f.flush()
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self._file_path, "a", encoding="utf-8")
+
+
+class QueryLogMiddleware:
+    """Sampled capture of request payloads for replay.
+
+    The sampling decision is made before anything else, so unsampled
+    requests pay for a single random() call. Sampled requests have their
+    body teed as it is received and are logged with status and latency
+    once the response finishes.
+    """
+
+    def __init__(self, app, writer, sample=QUERY_LOG_SAMPLE, paths=CAPTURED_PATHS):
+        self.app = app
+        self.writer = writer
+        self.sample = sample
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or random.random() >= self.sample
+            or not scope["path"].startswith(self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        start = time.perf_counter()
+        body = bytearray()
+        status = {}
+
+        async def tee_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, tee_receive, capture_send)
+        finally:
+            try:
+                payload = json.loads(body) if body else None
+            except ValueError:
+                payload = None
+            self.writer.write({
+                "ts": started_at,
+                "endpoint": scope["path"],
+                "method": scope["method"],
+                "query_string": scope.get("query_string", b"").decode("latin-1"),
+                "body": payload,
+                "status": status.get("code"),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            })
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Re-drive captured query logs against a running API and report latencies.
+
+    python backend/replay.py logs/queries-*.ndjson --url http://localhost:8000 --speed 4
+
+--speed 1 keeps the original inter-arrival times, larger values compress
+them, and 0 sends as fast as --concurrency allows.
+"""
+import argparse
+import glob
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_records(patterns):
+    records = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[rank]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured query log")
+    parser.add_argument("logs", nargs="+", help="NDJSON log files or glob patterns")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time compression factor; 0 = no pacing")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    records = load_records(args.logs)
+    if not records:
+        print("No records to replay")
+        return
+    print(f"Replaying {len(records)} requests against {args.url} at speed {args.speed or 'max'}")
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    # Sessions aren't thread-safe; give each pool thread its own connection pool
+    local = threading.local()
+
+    def send(record):
+        url = args.url.rstrip("/") + record["endpoint"]
+        if record.get("query_string"):
+            url += "?" + record["query_string"]
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.request(record["method"], url, json=record.get("body"), timeout=args.timeout)
+            # Drain streamed bodies (/chat) so the latency covers the full answer
+            _ = response.content
+            ok = response.status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies[record["endpoint"]].append(elapsed)
+            if not ok:
+                errors[record["endpoint"]] += 1
+
+    wall_start = time.perf_counter()
+    first_ts = records[0]["ts"]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for record in records:
+            if args.speed > 0:
+                due = (record["ts"] - first_ts) / args.speed
+                delay = due - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, record)
+    wall = time.perf_counter() - wall_start
+
+    print(f"Done in {wall:.1f}s ({len(records) / wall:.1f} req/s)")
+    print(f"{'endpoint':<28}{'count':>7}{'errors':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for endpoint in sorted(latencies):
+        values = latencies[endpoint]
+        print(
+            f"{endpoint:<28}{len(values):>7}{errors[endpoint]:>8}"
+            f"{percentile(values, 50):>9.1f}{percentile(values, 90):>9.1f}"
+            f"{percentile(values, 99):>9.1f}{max(values):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
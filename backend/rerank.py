@@ -0,0 +1,134 @@
+import os
+import re
+import time
+
+import numpy as np
+
+# How many FAISS candidates the second stage re-scores
+RERANK_DEPTH = int(os.environ.get("RERANK_DEPTH", 50))
+# Hard latency budget for the whole re-ranking stage; over budget we keep FAISS order
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", 30))
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", 32))
+# Optional cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2); empty keeps the feature scorer only
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "")
+
+# Feature weights for the linear scorer
+WEIGHTS = {
+    "similarity": 1.0,
+    "brand": 0.5,
+    "category": 0.3,
+    "price": 0.3,
+    "cross": 1.0,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PRICE_CAP_RE = re.compile(r"(?:under|below|less than|cheaper than|<)\s*\$?\s*(\d+(?:\.\d+)?)")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def parse_price_cap(query):
+    """Pull a price ceiling like 'under $200' out of a query, if there is one"""
+    match = _PRICE_CAP_RE.search(query.lower())
+    return float(match.group(1)) if match else None
+
+
+class Reranker:
+    """Batched second-stage scorer over the top FAISS candidates.
+
+    Candidates are re-scored with a weighted sum of the normalised FAISS
+    similarity, brand match, category overlap, a price-ceiling match and,
+    when RERANK_MODEL is set, a cross-encoder score. Work is done in batches
+    and abandoned as soon as the latency budget is spent.
+    """
+
+    def __init__(self, df, ids, higher_is_better):
+        rows = df.drop_duplicates(subset=["uniq_id"]).set_index("uniq_id").reindex(ids)
+        self.higher_is_better = higher_is_better
+        self.brands = [str(b).lower() for b in rows["brand"].fillna("")]
+        self.categories = [set(tokenize(c)) for c in rows["categories"].fillna("")]
+        self.prices = rows["price"].fillna(0).to_numpy(dtype=np.float32)
+        self.texts = rows["text"].fillna("").astype(str).tolist()
+        self.cross_encoder = None
+        if RERANK_MODEL:
+            from sentence_transformers import CrossEncoder
+            self.cross_encoder = CrossEncoder(RERANK_MODEL)
+        # Running per-candidate cost, used to skip up front when a batch can't fit
+        self._cost_per_item = 0.0
+        self.stats = {"reranked": 0, "skipped": 0}
+
+    def _feature_scores(self, query, indices, distances, higher_is_better):
+        sims = np.asarray(distances, dtype=np.float32)
+        if not higher_is_better:
+            sims = -sims
+        spread = sims.max() - sims.min()
+        sims = (sims - sims.min()) / spread if spread > 0 else np.ones_like(sims)
+
+        query_lower = query.lower()
+        query_tokens = set(tokenize(query))
+        brand = np.array(
+            [1.0 if self.brands[i] and self.brands[i] in query_lower else 0.0 for i in indices],
+            dtype=np.float32,
+        )
+        category = np.array(
+            [len(query_tokens & self.categories[i]) / max(len(query_tokens), 1) for i in indices],
+            dtype=np.float32,
+        )
+        cap = parse_price_cap(query)
+        if cap is None:
+            price = np.zeros(len(indices), dtype=np.float32)
+        else:
+            prices = self.prices[indices]
+            price = ((prices > 0) & (prices <= cap)).astype(np.float32)
+
+        return (
+            WEIGHTS["similarity"] * sims
+            + WEIGHTS["brand"] * brand
+            + WEIGHTS["category"] * category
+            + WEIGHTS["price"] * price
+        )
+
+    def rerank(self, query, candidates, depth=RERANK_DEPTH, higher_is_better=None):
+        """Reorder the first `depth` candidates in place; returns True if re-ranked"""
+        n = min(depth, len(candidates.indices))
+        if n < 2:
+            return False
+        budget = RERANK_BUDGET_MS / 1000.0
+        if self._cost_per_item * n > budget:
+            self.stats["skipped"] += 1
+            # Decay the estimate so a transient slowdown doesn't disable re-ranking for good
+            self._cost_per_item *= 0.9
+            print(f"Skipping re-rank: estimated {self._cost_per_item * n * 1000:.1f}ms over budget")
+            return False
+
+        start = time.perf_counter()
+        indices = candidates.indices[:n]
+        if higher_is_better is None:
+            higher_is_better = self.higher_is_better
+        scores = self._feature_scores(query, np.asarray(indices), candidates.distances[:n], higher_is_better)
+
+        if self.cross_encoder is not None:
+            cross = np.empty(n, dtype=np.float32)
+            for lo in range(0, n, RERANK_BATCH_SIZE):
+                if time.perf_counter() - start > budget:
+                    self._observe(start, n)
+                    self.stats["skipped"] += 1
+                    print("Skipping re-rank: latency budget spent mid-batch")
+                    return False
+                hi = min(lo + RERANK_BATCH_SIZE, n)
+                pairs = [(query, self.texts[i]) for i in indices[lo:hi]]
+                cross[lo:hi] = self.cross_encoder.predict(pairs, batch_size=RERANK_BATCH_SIZE)
+            scores = scores + WEIGHTS["cross"] * cross
+
+        order = np.argsort(-scores, kind="stable")
+        candidates.indices[:n] = [indices[j] for j in order]
+        candidates.distances[:n] = [candidates.distances[j] for j in order]
+        self._observe(start, n)
+        self.stats["reranked"] += 1
+        return True
+
+    def _observe(self, start, n):
+        cost = (time.perf_counter() - start) / n
+        self._cost_per_item = cost if not self._cost_per_item else 0.8 * self._cost_per_item + 0.2 * cost
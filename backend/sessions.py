@@ -0,0 +1,71 @@
+import importlib
+import os
+from abc import ABC, abstractmethod
+
+from chat import LRUCache
+
+# How many recent products feed a session vector
+SESSION_HISTORY = int(os.environ.get("SESSION_HISTORY", 10))
+# Weight multiplier per step back in history (1.0 = plain mean)
+SESSION_DECAY = float(os.environ.get("SESSION_DECAY", 0.8))
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", 1800))
+SESSION_MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", 100000))
+# Dotted "module:Class" path of an alternative SessionStore implementation
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "")
+
+
+class SessionStore(ABC):
+    """Interface for session history backends.
+
+    Implementations keep the most recent product ids per session, newest
+    last, and may expire idle sessions. A store that holds sessions in this
+    process should also define the optional memory-accounting methods that
+    MemoryMonitor uses: __len__ (number of sessions), sample(n) (up to n
+    recently used histories) and trim(fraction) (drop the least recently used
+    fraction). The app registers the store as a cache only when it has trim.
+    """
+
+    @abstractmethod
+    def get(self, session_id):
+        """Return the session's history, or [] for an unknown or expired session"""
+
+    @abstractmethod
+    def append(self, session_id, product_ids):
+        """Record product ids and return the updated history"""
+
+
+class InMemorySessionStore(LRUCache, SessionStore):
+    """Bounded, TTL-evicted in-process store; the local stand-in for a shared backend"""
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL_SECONDS, history=SESSION_HISTORY):
+        super().__init__(max_entries, ttl)
+        self.history = history
+
+    def get(self, session_id):
+        return list(super().get(session_id) or [])
+
+    def append(self, session_id, product_ids):
+        def extend(history):
+            history = list(history or [])
+            for pid in product_ids:
+                # Re-viewing a product moves it to the most recent slot
+                if pid in history:
+                    history.remove(pid)
+                history.append(pid)
+            return history[-self.history:]
+
+        return list(self.update(session_id, extend))
+
+
+def make_session_store():
+    """Build the configured session store (in-memory unless SESSION_BACKEND is set)"""
+    if not SESSION_BACKEND:
+        return InMemorySessionStore()
+    module_name, _, class_name = SESSION_BACKEND.partition(":")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    return store_class()
+
+
+def recency_weights(n, decay=SESSION_DECAY):
+    """Weights for a history of n items ordered oldest to newest"""
+    return [decay ** (n - 1 - i) for i in range(n)]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Run the shard processes once and share them between app workers.
+
+    python backend/shard_server.py --shard-dir models/shards --address /tmp/shards.sock
+    SHARD_DIR=models/shards SHARD_ADDRESS=/tmp/shards.sock gunicorn -c backend/gunicorn_conf.py
+
+Each app worker's ShardedIndex connects here instead of starting its own
+shard processes, so N workers search one copy of the index rather than N.
+The server loads every shard before it starts listening; a worker that
+can connect can search. gunicorn_conf.py starts one automatically when
+SHARD_DIR is set and SHARD_ADDRESS is not.
+
+Connections are authenticated with SHARD_AUTHKEY, which must be set when
+the address is host:port: the connection protocol unpickles what it
+receives. Unix sockets are made owner-only.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from sharding import MANIFEST, SHARD_ADDRESS, ShardPool, authkey_for, parse_address
+
+
+def serve(shard_dir, address):
+    # Refuse a TCP address without SHARD_AUTHKEY before loading anything
+    authkey = authkey_for(address)
+    with open(os.path.join(shard_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    pool = ShardPool(shard_dir, manifest["shards"])
+    pool.start()
+
+    # Server-side request id -> (connection, its send lock, the client's request id)
+    routes = {}
+    routes_lock = threading.Lock()
+    ids = itertools.count()
+
+    def relay_responses():
+        while True:
+            message = pool.responses.get()
+            if message is None:
+                return
+            server_id, result, error = message
+            if server_id is None:
+                # Readiness notice from a restarted shard
+                continue
+            with routes_lock:
+                route = routes.pop(server_id, None)
+            if route is None:
+                continue
+            conn, send_lock, req_id = route
+            try:
+                with send_lock:
+                    conn.send((req_id, result, error))
+            except OSError:
+                # The worker went away; its answer is no longer wanted
+                pass
+
+    def handle(conn):
+        send_lock = threading.Lock()
+        try:
+            while True:
+                shard_id, (req_id, op, payload) = conn.recv()
+                server_id = next(ids)
+                with routes_lock:
+                    routes[server_id] = (conn, send_lock, req_id)
+                pool.put(shard_id, (server_id, op, payload))
+        except (EOFError, OSError):
+            conn.close()
+
+    threading.Thread(target=relay_responses, daemon=True).start()
+    address = parse_address(address)
+    if isinstance(address, str) and os.path.exists(address):
+        # Left behind by a previous run
+        os.unlink(address)
+    with Listener(address, authkey=authkey) as listener:
+        if isinstance(address, str):
+            os.chmod(address, 0o600)
+        print(f"Shard server listening on {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve FAISS shards to app workers")
+    parser.add_argument("--shard-dir", default=os.environ.get("SHARD_DIR", "models/shards"))
+    parser.add_argument("--address", default=SHARD_ADDRESS or "/tmp/faiss-shards.sock",
+                        help="Unix socket path or host:port")
+    args = parser.parse_args()
+    serve(args.shard_dir, args.address)
+
+
+if __name__ == "__main__":
+    main()
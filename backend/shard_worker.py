@@ -0,0 +1,36 @@
+"""Shard process entry point.
+
+Kept free of app imports so the forkserver that starts shard processes
+can preload it cheaply.
+"""
+import faiss
+import numpy as np
+
+
+def serve_shard(shard_id, path, offset, requests, responses):
+    """Answer search/reconstruct/reload requests against one index file.
+
+    A (None, (shard_id, ntotal), None) message reports the index is loaded.
+    """
+    faiss.omp_set_num_threads(1)
+    index = faiss.read_index(path)
+    responses.put((None, (shard_id, index.ntotal), None))
+    while True:
+        message = requests.get()
+        if message is None:
+            return
+        req_id, op, payload = message
+        try:
+            if op == "search":
+                x, k = payload
+                D, I = index.search(x, min(k, index.ntotal))
+                # Translate local ids to global ones; keep FAISS's -1 padding as is
+                I = np.where(I >= 0, I + offset, -1)
+                responses.put((req_id, (D, I), None))
+            elif op == "reconstruct":
+                responses.put((req_id, index.reconstruct(int(payload) - offset), None))
+            elif op == "reload":
+                index = faiss.read_index(path)
+                responses.put((req_id, index.ntotal, None))
+        except Exception as e:
+            responses.put((req_id, None, str(e)))
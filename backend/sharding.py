@@ -0,0 +1,354 @@
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing.connection import Client
+
+import faiss
+import numpy as np
+
+from quantize import build_index
+from shard_worker import serve_shard
+
+# How long the coordinator waits for shard answers before responding without the missing ones
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", 200))
+# How long startup waits for every shard to load its index
+SHARD_START_TIMEOUT_S = float(os.environ.get("SHARD_START_TIMEOUT_S", 120))
+# Shard server (shard_server.py) shared by all app workers: a Unix socket path or host:port.
+# Unset, each app process starts a private one.
+SHARD_ADDRESS = os.environ.get("SHARD_ADDRESS", "")
+# Shared secret for shard server connections. multiprocessing.connection unpickles what it
+# receives, so TCP addresses require an explicit key; a private server gets a random one
+SHARD_AUTHKEY = os.environ.get("SHARD_AUTHKEY", "")
+
+MANIFEST = "manifest.json"
+SHARD_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_server.py")
+
+
+class ShardUnavailableError(RuntimeError):
+    """Raised when a shard doesn't answer within the deadline or the shard server is unreachable"""
+
+
+def shard_ranges(ntotal, num_shards):
+    """Split [0, ntotal) into contiguous, near-equal ranges"""
+    bounds = np.linspace(0, ntotal, num_shards + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def build_shards(vectors, num_shards, shard_dir, precision="fp32", metric=faiss.METRIC_INNER_PRODUCT):
+    """Write one index file per shard plus a manifest mapping shards to global id ranges"""
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    for i, (lo, hi) in enumerate(shard_ranges(len(vectors), num_shards)):
+        path = f"shard_{i}.bin"
+        faiss.write_index(build_index(vectors[lo:hi], precision, metric), os.path.join(shard_dir, path))
+        shards.append({"path": path, "offset": lo, "ntotal": hi - lo})
+    manifest = {"d": int(vectors.shape[1]), "metric": int(metric), "precision": precision, "shards": shards}
+    with open(os.path.join(shard_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def rebuild_shard(vectors, shard_dir, shard_id):
+    """Rebuild a single shard file from the full vector set, leaving the others untouched"""
+    with open(os.path.join(shard_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    shard = manifest["shards"][shard_id]
+    lo, hi = shard["offset"], shard["offset"] + shard["ntotal"]
+    index = build_index(vectors[lo:hi], manifest["precision"], manifest["metric"])
+    # Write then rename so a worker reloading mid-build never sees a partial file
+    path = os.path.join(shard_dir, shard["path"])
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return shard
+
+
+def parse_address(address):
+    """"host:port" is a TCP address; anything else is a Unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def authkey_for(address, key=SHARD_AUTHKEY):
+    """Connection auth key for a shard server address; TCP addresses need an explicit key"""
+    if key:
+        return key.encode()
+    if not isinstance(parse_address(address), str):
+        raise RuntimeError(f"SHARD_AUTHKEY must be set to serve or reach shards over TCP ({address})")
+    # Unix sockets are only reachable through the filesystem, and shard_server.py makes them owner-only
+    return b"faiss-shards"
+
+
+class ShardPool:
+    """One worker process per shard, run by shard_server.py.
+
+    Processes come from a forkserver that preloads shard_worker, so
+    starting or restarting a shard only pays for loading its index.
+    """
+
+    def __init__(self, shard_dir, shards):
+        self.shard_dir = shard_dir
+        self.shards = shards
+        self._ctx = mp.get_context("forkserver")
+        # Preload the worker's imports (faiss, numpy) instead of the default __main__
+        self._ctx.set_forkserver_preload(["shard_worker"])
+        self.responses = self._ctx.Queue()
+        self._requests = [None] * len(shards)
+        self._workers = [None] * len(shards)
+        self._lock = threading.Lock()
+
+    def start(self, timeout=SHARD_START_TIMEOUT_S):
+        """Start every shard and block until each one has loaded its index"""
+        for i in range(len(self.shards)):
+            self._start(i)
+        deadline = time.monotonic() + timeout
+        waiting = set(range(len(self.shards)))
+        while waiting:
+            remaining = deadline - time.monotonic()
+            dead = [i for i in waiting if not self._workers[i].is_alive()]
+            if dead or remaining <= 0:
+                self.close()
+                reason = "exited during load" if dead else f"not ready after {timeout:.0f}s"
+                raise RuntimeError(f"Shards {sorted(dead or waiting)} {reason}")
+            try:
+                req_id, result, _ = self.responses.get(timeout=min(1.0, remaining))
+            except queue.Empty:
+                continue
+            if req_id is None:
+                waiting.discard(result[0])
+        print(f"{len(self.shards)} shards ready")
+
+    def _start(self, shard_id):
+        shard = self.shards[shard_id]
+        requests = self._ctx.Queue()
+        worker = self._ctx.Process(
+            target=serve_shard,
+            args=(shard_id, os.path.join(self.shard_dir, shard["path"]), shard["offset"], requests, self.responses),
+            daemon=True,
+        )
+        worker.start()
+        self._requests[shard_id] = requests
+        self._workers[shard_id] = worker
+
+    def put(self, shard_id, message):
+        if not self._workers[shard_id].is_alive():
+            with self._lock:
+                if not self._workers[shard_id].is_alive():
+                    # Requests queue up while it reloads; callers' deadlines still apply
+                    print(f"Shard {shard_id} is down, restarting")
+                    self._start(shard_id)
+        self._requests[shard_id].put(message)
+
+    def close(self):
+        for requests in self._requests:
+            if requests is not None:
+                requests.put(None)
+        for worker in self._workers:
+            if worker is not None:
+                worker.join(timeout=5)
+        self.responses.put(None)
+
+
+def connect(address, timeout=SHARD_START_TIMEOUT_S, server=None, key=SHARD_AUTHKEY):
+    """Connect to a shard server, waiting for it to come up (it listens once its shards are loaded)"""
+    authkey = authkey_for(address, key)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(parse_address(address), authkey=authkey)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if server is not None and server.poll() is not None:
+                raise RuntimeError(f"Shard server exited with status {server.returncode} before it was ready")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Shard server at {address} not reachable after {timeout:.0f}s")
+            time.sleep(0.5)
+
+
+class ShardedIndex:
+    """Scatter-gather coordinator over one worker process per shard.
+
+    Each query embedding is sent to every shard at once and the per-shard
+    top-k lists are merged by distance. A shard that misses the deadline (or
+    has died) is left out of that answer rather than failing the request,
+    and the degraded answer is counted. Exposes the subset of the FAISS
+    index API the app uses, so it can stand in for a local index.
+
+    The shard processes live under a shard server (shard_server.py): a
+    shared one at `address`, so several app workers search one copy of the
+    index, or else a private one this process starts.
+    """
+
+    def __init__(self, shard_dir, timeout_ms=SHARD_TIMEOUT_MS, address=SHARD_ADDRESS):
+        with open(os.path.join(shard_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.shard_dir = shard_dir
+        self.address = address
+        self.d = manifest["d"]
+        self.metric_type = manifest["metric"]
+        self.shards = manifest["shards"]
+        self.ntotal = sum(s["ntotal"] for s in self.shards)
+        self.timeout = timeout_ms / 1000.0
+        self.stats = {"queries": 0, "degraded": 0, "shard_timeouts": [0] * len(self.shards)}
+
+        # Shards are started (or connected to) per process by start(), so a gunicorn
+        # master can preload this object and each worker attaches after fork
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        print(f"Sharded index: {len(self.shards)} shards, {self.ntotal} vectors")
+
+    def start(self, timeout=SHARD_START_TIMEOUT_S):
+        """Connect to the shards, starting a private shard server if there is no shared one,
+        and wait until all of them are ready; once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = {}
+            self._ids = itertools.count()
+            address, key, self._server = self.address, SHARD_AUTHKEY, None
+            if not address:
+                # Run the shard processes under shard_server.py rather than from here: spawned
+                # children re-import their parent's __main__, which here is the app itself
+                address = os.path.join(tempfile.gettempdir(), f"faiss-shards-{os.getpid()}-{id(self):x}.sock")
+                key = secrets.token_hex(32)
+                self._server = subprocess.Popen(
+                    [sys.executable, SHARD_SERVER, "--shard-dir", self.shard_dir, "--address", address],
+                    env={**os.environ, "SHARD_AUTHKEY": key},
+                )
+            self._conn = connect(address, timeout, self._server, key)
+            self._conn_lock = threading.Lock()
+            threading.Thread(target=self._dispatch, args=(self._conn.recv,), daemon=True).start()
+            self._pid = os.getpid()
+
+    def _dispatch(self, receive):
+        # Route shard responses to the waiting futures; late answers are dropped
+        while True:
+            try:
+                message = receive()
+            except (EOFError, OSError) as e:
+                # Shard server went away: fail what is in flight and reconnect on the next request
+                if self._pid is not None:
+                    print(f"Lost the shard server connection: {e!r}")
+                with self._pending_lock:
+                    pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    future.set_exception(ShardUnavailableError("shard server connection lost"))
+                self._pid = None
+                return
+            if message is None:
+                return
+            req_id, result, error = message
+            if req_id is None:
+                # Readiness notice from a restarted shard
+                continue
+            with self._pending_lock:
+                future = self._pending.pop(req_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _send(self, shard_id, op, payload):
+        # Blocks until the shards are up, so a cold start doesn't eat into the search deadline
+        self.start()
+        future = Future()
+        req_id = next(self._ids)
+        with self._pending_lock:
+            self._pending[req_id] = future
+        with self._conn_lock:
+            self._conn.send((shard_id, (req_id, op, payload)))
+        return req_id, future
+
+    def _wait(self, req_id, future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise ShardUnavailableError(f"shard request {req_id} got no answer before the deadline") from None
+        finally:
+            with self._pending_lock:
+                self._pending.pop(req_id, None)
+
+    def search(self, x, k):
+        D, I, _ = self.search_with_status(x, k)
+        return D, I
+
+    def search_with_status(self, x, k):
+        """search() plus whether every shard answered; partial answers must not be cached"""
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, self.d)
+        sent = [self._send(i, "search", (x, k)) for i in range(len(self.shards))]
+        # One deadline for the whole fan-out, not one timeout per shard
+        deadline = time.monotonic() + self.timeout
+        parts = []
+        for shard_id, (req_id, future) in enumerate(sent):
+            try:
+                parts.append(self._wait(req_id, future, max(0.0, deadline - time.monotonic())))
+            except RuntimeError as e:
+                self.stats["shard_timeouts"][shard_id] += 1
+                print(f"Shard {shard_id} dropped from results: {e}")
+        self.stats["queries"] += 1
+        if len(parts) < len(self.shards):
+            self.stats["degraded"] += 1
+
+        higher_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        pad = -np.inf if higher_is_better else np.inf
+        D_out = np.full((len(x), k), pad, dtype=np.float32)
+        I_out = np.full((len(x), k), -1, dtype=np.int64)
+        complete = len(parts) == len(self.shards)
+        if not parts:
+            return D_out, I_out, complete
+        D = np.concatenate([p[0] for p in parts], axis=1)
+        I = np.concatenate([p[1] for p in parts], axis=1)
+        D = np.where(I >= 0, D, pad)
+        order = np.argsort(-D if higher_is_better else D, axis=1, kind="stable")[:, :k]
+        n = order.shape[1]
+        D_out[:, :n] = np.take_along_axis(D, order, axis=1)
+        I_out[:, :n] = np.take_along_axis(I, order, axis=1)
+        return D_out, I_out, complete
+
+    def _shard_for(self, i):
+        for shard_id, shard in enumerate(self.shards):
+            if shard["offset"] <= i < shard["offset"] + shard["ntotal"]:
+                return shard_id
+        raise IndexError(f"Vector {i} is outside every shard")
+
+    def reconstruct(self, i):
+        req_id, future = self._send(self._shard_for(i), "reconstruct", int(i))
+        return self._wait(req_id, future, self.timeout)
+
+    def reconstruct_batch(self, ids):
+        sent = [self._send(self._shard_for(i), "reconstruct", int(i)) for i in ids]
+        deadline = time.monotonic() + self.timeout
+        return np.vstack([
+            self._wait(req_id, future, max(0.0, deadline - time.monotonic())) for req_id, future in sent
+        ])
+
+    def reload_shard(self, shard_id):
+        """Pick up a rebuilt shard file without touching the other shards"""
+        req_id, future = self._send(shard_id, "reload", None)
+        # Loading an index can take much longer than a search
+        return self._wait(req_id, future, max(self.timeout, 60))
+
+    def close(self):
+        """Disconnect, stopping this process's private shard server if it has one (both restart on next use)"""
+        with self._start_lock:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+            self._conn.close()
+            if self._server is not None:
+                self._server.terminate()
+                self._server.wait(timeout=10)
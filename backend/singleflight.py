@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is still running wait on the same future and get the same result (or
+    exception). Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "executions": 0, "collapsed": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.stats["executions"] += 1
+            else:
+                self.stats["collapsed"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "inflight": len(self._inflight)}
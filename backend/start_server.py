@@ -1,25 +1,40 @@
-#!/usr/bin/env python3
-
-import uvicorn
-import os
-import sys
-
-# Add the backend directory to the Python path
-backend_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, backend_dir)
-
-# Change to the project root directory (one level up from backend)
-project_root = os.path.dirname(backend_dir)
-os.chdir(project_root)
-
-print(f"Starting server from: {os.getcwd()}")
-print(f"Backend directory: {backend_dir}")
-
-if __name__ == "__main__":
-    try:
-        uvicorn.run("backend.app:app", host="0.0.0.0", port=8000, reload=True)
-    except Exception as e:
-        print(f"Error starting server: {e}")
-        import traceback
-        traceback.print_exc()
-
+#!/usr/bin/env python3
+
+import argparse
+import uvicorn
+import os
+import sys
+
+# Add the backend directory to the Python path
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+
+# Change to the project root directory (one level up from backend)
+project_root = os.path.dirname(backend_dir)
+os.chdir(project_root)
+
+print(f"Starting server from: {os.getcwd()}")
+print(f"Backend directory: {backend_dir}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the recommendation API")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="Number of worker processes; more than 1 uses the gunicorn production profile")
+    parser.add_argument("--cpu-affinity", action="store_true", help="Pin each worker to its own cores")
+    args = parser.parse_args()
+
+    try:
+        if args.workers > 1:
+            # Production mode: gunicorn preloads models once and forks workers
+            os.environ["WEB_CONCURRENCY"] = str(args.workers)
+            if args.cpu_affinity:
+                os.environ["CPU_AFFINITY"] = "1"
+            conf = os.path.join(backend_dir, "gunicorn_conf.py")
+            print(f"Starting {args.workers} workers with {conf}")
+            os.execvp("gunicorn", ["gunicorn", "-c", conf])
+        else:
+            uvicorn.run("backend.app:app", host="0.0.0.0", port=8000, reload=True)
+    except Exception as e:
+        print(f"Error starting server: {e}")
+        import traceback
+        traceback.print_exc()
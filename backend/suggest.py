@@ -0,0 +1,121 @@
+import ast
+import bisect
+import heapq
+import os
+from collections import Counter
+
+import numpy as np
+
+SUGGEST_LIMIT = int(os.environ.get("SUGGEST_LIMIT", 10))
+
+# Per-source boost so brands and categories outrank a single product title
+TYPE_WEIGHTS = {"category": 3.0, "brand": 2.0, "title": 1.0}
+
+
+def parse_categories(value):
+    """Parse a categories cell like "['Home & Kitchen', 'Furniture']" into a list"""
+    if not isinstance(value, str):
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+        if isinstance(parsed, (list, tuple)):
+            return [str(c).strip() for c in parsed if str(c).strip()]
+    except (ValueError, SyntaxError):
+        pass
+    # Fall back to the same loose parsing /analytics uses
+    value = value.strip("[]'\"")
+    return [c.strip().strip("'\"") for c in value.split(",") if c.strip().strip("'\"")]
+
+
+class SuggestIndex:
+    """Typeahead over catalog titles, brands and category names.
+
+    Keys are kept in one sorted list, so a prefix maps to a contiguous range
+    found with two binary searches. A sparse table over the scores answers
+    "best entry in this range" in O(1), so the top completions of any
+    prefix come out best-first after O(limit) lookups, however many keys
+    share the prefix.
+    """
+
+    def __init__(self, df, limit=SUGGEST_LIMIT):
+        counts = Counter()
+        if "title" in df.columns:
+            counts.update(("title", t) for t in df["title"].dropna().astype(str))
+        if "brand" in df.columns:
+            counts.update(("brand", b) for b in df["brand"].dropna().astype(str))
+        if "categories" in df.columns:
+            for value in df["categories"].dropna():
+                counts.update(("category", c) for c in parse_categories(value))
+
+        # Merge sources that produce the same text, keeping the strongest type
+        entries = {}
+        for (kind, text), count in counts.items():
+            text = " ".join(text.split())
+            key = text.lower()
+            if not key:
+                continue
+            score = count * TYPE_WEIGHTS[kind]
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = [text, kind, count, score]
+            else:
+                entry[2] += count
+                if score > entry[3]:
+                    entry[0], entry[1] = text, kind
+                entry[3] += score
+
+        self.keys = sorted(entries)
+        self.entries = [tuple(entries[k]) for k in self.keys]
+        self.limit = limit
+        self.scores = np.array([e[3] for e in self.entries], dtype=np.float64)
+        self._best = self._sparse_table(self.scores)
+        print(f"Suggest index built: {len(self.keys)} entries, {len(self._best)} range-max levels")
+
+    @staticmethod
+    def _sparse_table(scores):
+        """Level j holds, for each i, the best position in [i, i + 2**j); ties go to the earlier key"""
+        levels = [np.arange(len(scores), dtype=np.int32)]
+        width = 1
+        while 2 * width <= len(scores):
+            prev = levels[-1]
+            left, right = prev[:len(prev) - width], prev[width:]
+            levels.append(np.where(scores[right] > scores[left], right, left))
+            width *= 2
+        return levels
+
+    def _argmax(self, lo, hi):
+        """Best position in the non-empty range [lo, hi)"""
+        level = (hi - lo).bit_length() - 1
+        left = int(self._best[level][lo])
+        right = int(self._best[level][hi - (1 << level)])
+        return right if self.scores[right] > self.scores[left] else left
+
+    def _rank(self, lo, hi, limit):
+        # Best-first expansion: pop the best of a range, then offer the best of each side of it
+        heap, best = [], []
+        if lo < hi:
+            i = self._argmax(lo, hi)
+            heap.append((-self.scores[i], i, lo, hi))
+        while heap and len(best) < limit:
+            _, i, lo, hi = heapq.heappop(heap)
+            best.append(i)
+            for a, b in ((lo, i), (i + 1, hi)):
+                if a < b:
+                    j = self._argmax(a, b)
+                    heapq.heappush(heap, (-self.scores[j], j, a, b))
+        return [
+            {"text": self.entries[i][0], "type": self.entries[i][1], "count": self.entries[i][2]}
+            for i in best
+        ]
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\uffff", lo)
+        return lo, hi
+
+    def suggest(self, prefix, limit=None):
+        limit = min(limit or self.limit, self.limit)
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        return self._rank(*self._range(prefix), limit)
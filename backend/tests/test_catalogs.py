@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+
+import pytest
+
+import catalogs
+from catalogs import CatalogRegistry, load_catalog_configs
+
+MB = 2**20
+
+
+class FakeCatalog:
+    """Stands in for Catalog: 0.6 MB resident, slow to load"""
+
+    instances = []
+
+    def __init__(self, catalog_id, config):
+        time.sleep(0.05)
+        self.id = catalog_id
+        self.version = "v1"
+        self.closed = False
+        FakeCatalog.instances.append(self)
+
+    def nbytes(self):
+        return int(0.6 * MB)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_registry(monkeypatch):
+    FakeCatalog.instances = []
+    monkeypatch.setattr(catalogs, "Catalog", FakeCatalog)
+
+    def make(pinned=(), budget_mb=1, admit=None):
+        configs = {name: {} for name in ("default", "outdoor", "office")}
+        return CatalogRegistry(configs, budget_mb=budget_mb, pinned=pinned, admit=admit)
+
+    return make
+
+
+def test_concurrent_first_requests_share_one_load(make_registry):
+    registry = make_registry()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("outdoor"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(FakeCatalog.instances) == 1
+    assert all(c is results[0] for c in results)
+    assert registry.stats["loads"] == 1
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_least_recently_used_catalogs_are_evicted_over_budget(make_registry):
+    registry = make_registry()
+    default = registry.get("default")
+    outdoor = registry.get("outdoor")
+    # Two 0.6 MB catalogs exceed 1 MB: the older one goes
+    assert [c.id for c in registry.loaded()] == ["outdoor"]
+    assert default.closed and not outdoor.closed
+    assert registry.stats["evictions"] == 1
+
+
+def test_pinned_catalogs_are_never_evicted(make_registry):
+    registry = make_registry(pinned={"default"})
+    registry.get("default")
+    registry.get("outdoor")
+    registry.get("office")
+    assert [c.id for c in registry.loaded()] == ["default", "office"]
+
+    assert registry.evict_one()
+    assert not registry.evict_one()
+    assert [c.id for c in registry.loaded()] == ["default"]
+
+
+def test_admission_can_refuse_a_load(make_registry):
+    def admit(name, estimated_bytes):
+        raise MemoryError(name)
+
+    registry = make_registry(admit=admit)
+    with pytest.raises(MemoryError):
+        registry.get("outdoor")
+    assert registry.loaded() == [] and FakeCatalog.instances == []
+
+
+def test_configured_catalogs_inherit_no_artifacts(tmp_path):
+    path = tmp_path / "catalogs.json"
+    path.write_text(json.dumps({
+        "outdoor": {"data": "outdoor.csv", "meta": "outdoor.pkl", "index": "outdoor.bin"},
+        "sharded": {"data": "s.csv", "meta": "s.pkl", "shard_dir": "shards/"},
+    }))
+    configs = load_catalog_configs(str(path))
+    assert configs["outdoor"]["clustered"] is None
+    assert configs["outdoor"]["duplicates"] is None
+    assert configs["sharded"]["index"] is None
+    assert configs["default"]["data"] == "data/cleaned_products.csv"
+
+
+@pytest.mark.parametrize("config, missing", [
+    ({"meta": "m.pkl", "index": "i.bin"}, "data"),
+    ({"data": "d.csv", "index": "i.bin"}, "meta"),
+    ({"data": "d.csv", "meta": "m.pkl"}, "index"),
+])
+def test_configured_catalogs_must_name_their_artifacts(tmp_path, config, missing):
+    path = tmp_path / "catalogs.json"
+    path.write_text(json.dumps({"outdoor": config}))
+    with pytest.raises(ValueError, match=f"'outdoor'.*missing {missing}"):
+        load_catalog_configs(str(path))
@@ -0,0 +1,79 @@
+import math
+
+import pandas as pd
+
+from chat import Conversation, ConversationStore, LRUCache, Vocabulary, apply_filters, rewrite_turn
+
+RESULTS = [
+    {"title": "Oak chair", "brand": "Acme", "color": "Black", "price": 120.0},
+    {"title": "Pine chair", "brand": "Woodco", "color": "Light Grey", "price": 80.0},
+    {"title": "Steel chair", "brand": "Acme", "color": "Grey", "price": math.nan},
+]
+
+
+def _vocab():
+    return Vocabulary(pd.DataFrame({
+        "color": ["Black", "Grey", "Light Grey", "A long free text colour description"],
+        "brand": ["Acme", "Woodco", None, "Acme"],
+    }))
+
+
+def _conversation():
+    conversation = Conversation("c1")
+    conversation.query = "office chair"
+    conversation.last_results = RESULTS
+    return conversation
+
+
+def test_a_fresh_request_starts_a_new_search():
+    query, filters, follow_up = rewrite_turn("oak dining table under $300", _conversation(), _vocab())
+    assert (query, filters, follow_up) == ("oak dining table under $300", {"max_price": 300.0}, False)
+
+
+def test_refinements_keep_the_previous_query():
+    conversation = _conversation()
+    query, filters, follow_up = rewrite_turn("anything cheaper?", conversation, _vocab())
+    # Undercuts the cheapest priced result shown so far; the NaN price is ignored
+    assert (query, follow_up) == ("office chair", True)
+    assert filters == {"max_price": 79.99}
+
+    conversation.filters = filters
+    query, filters, follow_up = rewrite_turn("in light grey please", conversation, _vocab())
+    assert follow_up
+    assert filters == {"max_price": 79.99, "color": "light grey"}
+
+    conversation.filters = filters
+    _, filters, follow_up = rewrite_turn("any price", conversation, _vocab())
+    assert follow_up and filters == {}
+
+
+def test_apply_filters():
+    assert apply_filters(RESULTS, {}) == RESULTS
+    assert [r["title"] for r in apply_filters(RESULTS, {"max_price": 100})] == ["Pine chair"]
+    # Substring colour match, exact brand match; unpriced items fail a price ceiling
+    assert [r["title"] for r in apply_filters(RESULTS, {"color": "grey"})] == ["Pine chair", "Steel chair"]
+    assert [r["title"] for r in apply_filters(RESULTS, {"brand": "acme", "max_price": 500})] == ["Oak chair"]
+
+
+def test_lru_cache_expires_entries_after_the_ttl():
+    cache = LRUCache(2, ttl=-1)
+    cache.put("q", 1)
+    assert cache.get("q") is None and len(cache) == 0
+
+    cache = LRUCache(2, ttl=60)
+    assert cache.update("q", lambda v: (v or 0) + 1) == 1
+    assert cache.update("q", lambda v: (v or 0) + 1) == 2
+    cache.put("r", 0)
+    cache.put("s", 0)
+    assert cache.get("q") is None
+    assert cache.sample(5) == [0, 0]
+
+
+def test_conversations_are_resumed_until_they_expire():
+    store = ConversationStore(max_entries=10, ttl=60)
+    conversation = store.get_or_create()
+    assert store.get_or_create(conversation.id) is conversation
+
+    store = ConversationStore(max_entries=10, ttl=-1)
+    conversation = store.get_or_create("c1")
+    assert store.get_or_create("c1") is not conversation
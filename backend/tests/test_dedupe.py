@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from dedupe import candidate_pairs, canonical_positions, group_pairs, minhash_signatures
+
+
+def _vectors():
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(50, 16)).astype(np.float32)
+    # Rows 10 and 20 are near-copies of rows 0 and 1
+    base[10] = base[0] + 0.01
+    base[20] = base[1] + 0.01
+    return base
+
+
+@pytest.mark.parametrize("method", ["knn", "range"])
+def test_candidate_pairs_finds_near_copies(method):
+    i, j, sims = candidate_pairs(_vectors(), threshold=0.99, method=method, k=5, block_size=7)
+    assert sorted(zip(i.tolist(), j.tolist())) == [(0, 10), (1, 20)]
+    assert (sims >= 0.99).all()
+
+
+def test_minhash_matches_identical_titles_only():
+    signatures, empty = minhash_signatures(
+        ["oak dining table set", "oak dining table set", "blue garden hose reel", ""]
+    )
+    assert (signatures[0] == signatures[1]).all()
+    assert (signatures[0] == signatures[2]).mean() < 0.5
+    assert empty.tolist() == [False, False, False, True]
+
+
+def test_groups_pick_first_priced_member_as_canonical():
+    roots = group_pairs(6, np.array([0, 1, 4]), np.array([1, 2, 5]))
+    assert roots.tolist() == [0, 0, 0, 3, 4, 4]
+    priced = np.array([False, True, True, False, False, False])
+    assert canonical_positions(roots, priced).tolist() == [1, 1, 1, 3, 4, 4]
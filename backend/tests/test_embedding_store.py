@@ -0,0 +1,91 @@
+import json
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from embedding_store import EmbeddingStore, embed_catalog
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Replace the sentence-transformers model with one that records what it encodes"""
+    texts = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        def encode(self, batch, **kwargs):
+            texts.extend(batch)
+            return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in batch], dtype=np.float32)
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeModel))
+    return texts
+
+
+def _catalog(texts):
+    return pd.DataFrame({"uniq_id": [f"p{i}" for i in range(len(texts))], "text": texts})
+
+
+def test_only_new_or_changed_rows_are_encoded(tmp_path, encoded):
+    store = str(tmp_path / "store")
+    ids, first = embed_catalog(_catalog(["oak table", "steel chair", "lamp"]), "enc", store)
+    assert ids == ["p0", "p1", "p2"]
+    assert encoded == ["oak table", "steel chair", "lamp"]
+
+    encoded.clear()
+    # p1's text changed and p3 is new; p0 and p2 come from the store
+    ids, second = embed_catalog(_catalog(["oak table", "steel chairs", "lamp", "rug"]), "enc", store)
+    assert encoded == ["steel chairs", "rug"]
+    np.testing.assert_array_equal(second[[0, 2]], first[[0, 2]])
+
+    encoded.clear()
+    embed_catalog(_catalog(["oak table", "steel chairs", "lamp", "rug"]), "enc", store)
+    assert encoded == []
+
+
+def test_a_new_encoder_version_invalidates_every_row(tmp_path, encoded):
+    store = str(tmp_path / "store")
+    embed_catalog(_catalog(["oak table", "lamp"]), "enc", store, encoder_version="v1")
+    encoded.clear()
+    embed_catalog(_catalog(["oak table", "lamp"]), "enc", store, encoder_version="v2")
+    assert encoded == ["oak table", "lamp"]
+
+
+def test_saving_drops_stale_entries(tmp_path, encoded):
+    store = str(tmp_path / "store")
+    embed_catalog(_catalog(["oak table", "lamp", "rug"]), "enc", store)
+    embed_catalog(_catalog(["oak table"]), "enc", store)
+    assert len(EmbeddingStore(store).keys) == 1
+
+
+def test_an_interrupted_save_leaves_the_previous_store(tmp_path, encoded, monkeypatch):
+    store = str(tmp_path / "store")
+    embed_catalog(_catalog(["oak table", "lamp"]), "enc", store)
+
+    # Crash after the new arrays are written but before info.json is swapped in
+    def crash(src, dst):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr("embedding_store.os.replace", crash)
+        with pytest.raises(KeyboardInterrupt):
+            embed_catalog(_catalog(["oak table", "rug", "sofa"]), "enc", store)
+
+    reloaded = EmbeddingStore(store)
+    assert len(reloaded.keys) == len(reloaded.vectors) == 2
+    encoded.clear()
+    embed_catalog(_catalog(["oak table", "lamp"]), "enc", store)
+    assert encoded == []
+
+
+def test_a_store_that_disagrees_with_its_info_is_ignored(tmp_path, encoded):
+    store = tmp_path / "store"
+    embed_catalog(_catalog(["oak table", "lamp"]), "enc", str(store))
+    info = json.loads((store / "info.json").read_text())
+    info["count"] = 5
+    (store / "info.json").write_text(json.dumps(info))
+    assert len(EmbeddingStore(str(store)).keys) == 0
@@ -0,0 +1,68 @@
+import faiss
+import numpy as np
+import pandas as pd
+
+from facets import FacetEngine
+from pagination import ensure_depth, search_candidates
+
+
+def _engine():
+    df = pd.DataFrame({
+        "uniq_id": ["a", "b", "c", "d", "e"],
+        "brand": ["Acme", "Acme", "Birch", None, "acme"],
+        "categories": [
+            "['Furniture', 'Chairs']", "['Furniture', 'Tables']", "['Furniture', 'Chairs']", "['Garden']", "['Furniture', 'Chairs']",
+        ],
+        "color": ["Black", "black", "White", "Green", "Black"],
+        "material": ["Oak", "Oak", "Steel", "", "Pine"],
+        "price": [40.0, 120.0, 0.0, 30.0, None],
+    })
+    clustered = pd.DataFrame({"uniq_id": ["a", "b", "c", "d", "e"], "cluster": [0, 0, 1, 2, 1]})
+    return FacetEngine(df, clustered, ["a", "b", "c", "d", "e"])
+
+
+def test_totals_ignore_unpriced_products():
+    totals = _engine().query()["totals"]
+    assert totals == {"count": 5, "avg_price": 63.33, "min_price": 30.0, "max_price": 120.0}
+
+
+def test_filters_are_case_insensitive_and_categories_match_subtrees():
+    engine = _engine()
+    assert engine.query({"color": ["BLACK"]})["totals"]["count"] == 3
+    assert engine.query({"category": ["furniture"]})["totals"]["count"] == 4
+    # OR within a dimension, AND across dimensions
+    assert engine.query({"brand": ["Acme", "Birch"], "material": ["oak"]})["totals"]["count"] == 2
+
+
+def test_group_by_category_level_and_price_band():
+    engine = _engine()
+    result = engine.query(group_by=["category"], category_level=1)
+    assert [(g["category"], g["count"]) for g in result["groups"]] == [("Furniture", 4), ("Garden", 1)]
+
+    bands = {g["price_band"]: g["count"] for g in engine.query(group_by=["price_band"])["groups"]}
+    assert bands == {"25-50": 2, "100-250": 1, "unknown": 2}
+
+
+def test_facet_counts_over_candidate_positions():
+    facets = _engine().facet_counts(np.array([0, 1, 4]))
+    assert facets["color"] == [{"value": "Black", "count": 2}, {"value": "black", "count": 1}]
+    assert facets["category"] == [
+        {"value": "Furniture > Chairs", "count": 2},
+        {"value": "Furniture > Tables", "count": 1},
+    ]
+
+
+def test_search_facets_are_the_same_on_every_page():
+    engine = _engine()
+    vectors = np.random.default_rng(0).normal(size=(5, 4)).astype(np.float32)
+    index = faiss.IndexFlatIP(4)
+    index.add(vectors)
+
+    # Page 1 of a top_k=2 search: the list only holds the first page's hits
+    candidates = search_candidates(index, vectors[0], 2)
+    first = engine.search_facets(index, candidates, depth=4)
+    # Page 2 continues the same (cached) list
+    ensure_depth(index, candidates, 4)
+    second = engine.search_facets(index, candidates, depth=4)
+    assert first == second
+    assert sum(f["count"] for f in first["brand"]) == 4
@@ -0,0 +1,24 @@
+import gc
+import types
+
+from gunicorn_conf import free_slot, pre_fork
+
+
+def _server(*slots):
+    workers = {pid: types.SimpleNamespace(slot=slot) for pid, slot in enumerate(slots)}
+    return types.SimpleNamespace(WORKERS=workers)
+
+
+def test_workers_take_the_lowest_free_slot():
+    assert free_slot(_server()) == 0
+    assert free_slot(_server(0, 1, 2)) == 3
+
+
+def test_a_respawned_worker_reuses_its_predecessors_slot():
+    # The worker in slot 1 died and was reaped; its replacement gets its cores
+    worker = types.SimpleNamespace()
+    try:
+        pre_fork(_server(0, 2, 3), worker)
+    finally:
+        gc.unfreeze()
+    assert worker.slot == 1
@@ -0,0 +1,43 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from http_cache import CompressionMiddleware, cached_response, make_etag
+
+
+def _client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/item")
+    def item(request: Request):
+        return cached_response(request, make_etag("v1", "item"), lambda: {"text": "x" * 2000})
+
+    return TestClient(app)
+
+
+def test_etag_is_weak_and_shared_by_every_encoding():
+    client = _client()
+    gzipped = client.get("/item", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/item", headers={"Accept-Encoding": "identity"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in identity.headers
+    assert gzipped.headers["etag"].startswith('W/"')
+    assert gzipped.headers["etag"] == identity.headers["etag"]
+    # One Vary, from the compression middleware
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+
+
+def test_if_none_match_uses_weak_comparison():
+    client = _client()
+    etag = client.get("/item").headers["etag"]
+    for sent in (etag, etag[2:], f'"other", {etag}', "*"):
+        response = client.get("/item", headers={"If-None-Match": sent})
+        assert response.status_code == 304, sent
+        assert response.headers["vary"] == "Accept-Encoding"
+    assert client.get("/item", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_etag_changes_with_version_and_key():
+    assert make_etag("v1", "a") == make_etag("v1", "a")
+    assert make_etag("v1", "a") != make_etag("v2", "a")
+    assert make_etag("v1", "a") != make_etag("v1", "b")
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lexical import BM25Index, lexical_candidates, reciprocal_rank_fusion
+from pagination import ensure_depth
+
+
+def _brute_force(index, k):
+    """Exact BM25 totals over every posting of every term in the index"""
+    scores = np.zeros(index.num_docs, dtype=np.float32)
+    np.add.at(scores, index.doc_ids, index.impacts)
+    matched = np.flatnonzero(scores > 0)
+    return np.sort(scores[matched])[::-1][:k]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("k", [1, 5, 40])
+def test_pruned_top_k_matches_brute_force(seed, k):
+    rng = np.random.default_rng(seed)
+    num_docs, num_terms = 3000, 3
+    term_ids, doc_ids, impacts = [], [], []
+    for t in range(num_terms):
+        docs = rng.choice(num_docs, int(rng.integers(200, 2000)), replace=False)
+        term_ids.append(np.full(len(docs), t))
+        doc_ids.append(docs)
+        # Coarse impacts produce many ties, the hard case for the threshold stop
+        impacts.append(rng.choice([0.5, 1.0, 1.5, 2.0], len(docs)).astype(np.float32))
+    vocab = {f"term{t}": t for t in range(num_terms)}
+    index = BM25Index.from_postings(
+        vocab, num_docs, np.concatenate(term_ids), np.concatenate(doc_ids), np.concatenate(impacts)
+    )
+
+    docs, scores = index.search(" ".join(vocab), k)
+    np.testing.assert_allclose(scores, _brute_force(index, k), rtol=1e-6)
+    # The returned documents really have those scores
+    totals = np.zeros(num_docs, dtype=np.float32)
+    np.add.at(totals, index.doc_ids, index.impacts)
+    np.testing.assert_allclose(totals[docs], scores, rtol=1e-6)
+
+
+def _catalog():
+    titles = [f"oak table model {i}" for i in range(30)] + ["steel chair", "oak chair", "garden hose"]
+    return pd.DataFrame({"uniq_id": [f"p{i}" for i in range(len(titles))], "title": titles})
+
+
+def test_search_ranks_matching_documents():
+    df = _catalog()
+    index = BM25Index(df, df["uniq_id"].tolist())
+    docs, scores = index.search("oak chair", 3)
+    # The only document with both terms comes first
+    assert docs[0] == 31
+    assert scores == sorted(scores, reverse=True)
+    assert index.search("sofa", 5) == ([], [])
+
+
+def test_lexical_candidates_page_past_the_first_depth():
+    df = _catalog()
+    index = BM25Index(df, df["uniq_id"].tolist())
+    candidates = lexical_candidates(index, "oak", 5)
+    # More than 5 documents match, so the first page must leave room for a cursor
+    assert not candidates.exhausted
+    ensure_depth(None, candidates, 20)
+    assert len(candidates.indices) >= 20
+    assert len(set(candidates.indices)) == len(candidates.indices)
+
+    ensure_depth(None, candidates, 100)
+    # Every "oak" document, then the list reports it is complete
+    assert len(candidates.indices) == 31
+    assert candidates.exhausted
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    docs, _ = reciprocal_rank_fusion([1, 2, 3], [2, 4, 5])
+    assert docs[0] == 2
+    assert set(docs) == {1, 2, 3, 4, 5}
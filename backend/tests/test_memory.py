@@ -0,0 +1,85 @@
+import pytest
+
+import memory
+from chat import LRUCache
+from memory import MemoryBudgetError, MemoryMonitor
+
+MB = 2**20
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Simulated resident set size, in MB"""
+    state = {"mb": 0}
+    monkeypatch.setattr(memory, "process_rss", lambda: int(state["mb"] * MB))
+    return state
+
+
+def _catalogs(rss, sizes_mb):
+    """Evictor over fake catalogs that give their size back to the simulated RSS, oldest first"""
+    resident = list(sizes_mb)
+
+    def evict_one():
+        if not resident:
+            return False
+        rss["mb"] -= resident.pop(0)
+        return True
+
+    return resident, evict_one
+
+
+def test_enforce_trims_caches_down_to_the_cache_budget(rss):
+    cache = LRUCache(1000)
+    for i in range(200):
+        cache.put(i, "x" * 10_000)
+    monitor = MemoryMonitor(cache_budget_mb=0.5)
+    monitor.add_caches(lambda: {"descriptions": cache})
+    monitor.enforce()
+    assert monitor.cache_sizes()["descriptions"] <= 0.5 * MB
+    assert 0 < len(cache) < 200
+    # The most recently used entries survive
+    assert cache.get(199) is not None
+    assert monitor.stats["cache_trims"] >= 1
+
+
+def test_enforce_clears_caches_then_evicts_catalogs_until_under_budget(rss):
+    rss["mb"] = 900
+    cache = LRUCache(10)
+    cache.put("q", "x")
+    resident, evict_one = _catalogs(rss, [300, 300, 100])
+    monitor = MemoryMonitor(budget_mb=500)
+    monitor.add_caches(lambda: {"embeddings": cache})
+    monitor.add_evictor(evict_one)
+    monitor.enforce()
+    assert len(cache) == 0
+    assert resident == [100]
+    assert rss["mb"] == 300
+    assert monitor.stats["catalog_evictions"] == 2
+
+
+def test_admit_makes_room_or_refuses(rss):
+    rss["mb"] = 400
+    resident, evict_one = _catalogs(rss, [200])
+    monitor = MemoryMonitor(budget_mb=500)
+    monitor.add_evictor(evict_one)
+
+    monitor.admit("small", 50 * MB)
+    assert resident == [200]
+
+    # Fits once the resident catalog is evicted
+    monitor.admit("medium", 250 * MB)
+    assert resident == []
+
+    with pytest.raises(MemoryBudgetError, match="large"):
+        monitor.admit("large", 400 * MB)
+    assert monitor.stats["refused_loads"] == 1
+
+
+def test_no_budget_means_no_enforcement(rss):
+    rss["mb"] = 10_000
+    resident, evict_one = _catalogs(rss, [300])
+    monitor = MemoryMonitor()
+    monitor.add_evictor(evict_one)
+    monitor.enforce()
+    monitor.admit("anything", 10_000 * MB)
+    assert resident == [300]
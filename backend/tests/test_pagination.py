@@ -0,0 +1,102 @@
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from pagination import (
+    CandidateCache,
+    Candidates,
+    CursorError,
+    collapse_duplicates,
+    decode_cursor,
+    encode_cursor,
+    ensure_depth,
+    query_key,
+    search_candidates,
+)
+
+
+def _index(n=200, d=8):
+    vectors = np.random.default_rng(0).normal(size=(n, d)).astype(np.float32)
+    index = faiss.IndexFlatIP(d)
+    index.add(vectors)
+    return index, vectors
+
+
+def test_cursor_round_trip_and_rejects_malformed_cursors():
+    key = query_key("oak table", "vector", False, "default")
+    assert decode_cursor(encode_cursor("abc", key, 10)) == ("abc", key, 10)
+    for bad in ("abc.10", "abc..10", "abc.key.-1", "abc.key.ten", ""):
+        with pytest.raises(CursorError):
+            decode_cursor(bad)
+
+
+def test_query_key_binds_text_mode_rerank_and_catalog():
+    base = query_key("oak table", "vector", False, "default")
+    assert base == query_key("oak table", "vector", False, "default")
+    assert base != query_key("oak tables", "vector", False, "default")
+    assert base != query_key("oak table", "lexical", False, "default")
+    assert base != query_key("oak table", "vector", True, "default")
+    assert base != query_key("oak table", "vector", False, "outdoor")
+
+
+def test_pages_concatenate_to_one_deep_search():
+    index, vectors = _index()
+    candidates = search_candidates(index, vectors[0], 10)
+    assert not candidates.exhausted
+    ensure_depth(index, candidates, 35)
+    _, I = index.search(vectors[:1], len(candidates.indices))
+    assert candidates.indices == I[0].tolist()
+
+    ensure_depth(index, candidates, 1000)
+    assert len(candidates.indices) == index.ntotal
+    assert candidates.exhausted
+
+
+def test_concurrent_deepening_appends_each_hit_once():
+    index, vectors = _index()
+
+    class SlowGroups:
+        """Identity grouping that yields the GIL, so unsynchronised appends would interleave"""
+
+        def __getitem__(self, i):
+            time.sleep(0.0005)
+            return i
+
+    candidates = search_candidates(index, vectors[0], 10)
+    threads = [
+        threading.Thread(target=ensure_depth, args=(index, candidates, depth, SlowGroups())) for depth in (30, 40)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(candidates.indices) == len(set(candidates.indices))
+    _, I = index.search(vectors[:1], len(candidates.indices))
+    assert candidates.indices == I[0].tolist()
+
+
+def test_duplicates_collapse_onto_the_best_ranked_member():
+    index, vectors = _index()
+    # Every position collapses onto its value mod 50: 50 groups
+    canonical = np.arange(index.ntotal) % 50
+    candidates = collapse_duplicates(search_candidates(index, vectors[0], 20), canonical)
+    ensure_depth(index, candidates, 60, canonical)
+    groups = [int(canonical[i]) for i in candidates.indices]
+    assert len(groups) == len(set(groups)) == 50
+    assert candidates.exhausted
+
+
+def test_candidate_cache_evicts_oldest_and_expired():
+    cache = CandidateCache(max_entries=2)
+    tokens = [cache.add(Candidates(None, [i], [0.0], True)) for i in range(3)]
+    assert cache.get(tokens[0]) is None
+    assert cache.get(tokens[2]).indices == [2]
+
+    expired = CandidateCache(max_entries=2, ttl=-1)
+    assert expired.get(expired.add(Candidates(None, [9], [0.0], True))) is None
+
+    cache.trim(1.0)
+    assert len(cache) == 0
@@ -0,0 +1,49 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+from profiling import Profile, current_profile, torch_ops
+
+
+def test_request_capture_follows_the_request_into_worker_threads():
+    profile = Profile("test")
+    token = profiling._request_profile.set(profile)
+    try:
+        context = contextvars.copy_context()
+    finally:
+        profiling._request_profile.reset(token)
+    # Threadpool endpoints run in a copy of the request's context
+    with ThreadPoolExecutor(1) as pool:
+        assert pool.submit(context.run, current_profile).result() is profile
+        # Other requests are not captured
+        assert pool.submit(current_profile).result() is None
+
+
+def test_torch_ops_without_a_capture_is_a_no_op():
+    with torch_ops():
+        pass
+    assert current_profile() is None
+
+
+def test_overlapping_model_calls_are_counted_not_nested():
+    profile = Profile("test")
+    inside, release = threading.Event(), threading.Event()
+
+    def model_call():
+        with torch_ops(profile):
+            # A nested call on the same thread joins the running section
+            with torch_ops(profile):
+                inside.set()
+                release.wait(5)
+
+    thread = threading.Thread(target=model_call)
+    thread.start()
+    inside.wait(5)
+    with torch_ops(profile):
+        pass
+    release.set()
+    thread.join()
+    assert profile.torch_skipped == 1
+    # The table always says something, with or without torch installed
+    assert profile.torch_table().strip()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from quantize import ExactRerankIndex, build_index, index_footprint
+
+
+def _vectors(n=400, d=32):
+    return np.random.default_rng(0).normal(size=(n, d)).astype(np.float32)
+
+
+@pytest.mark.parametrize("precision, code_size", [("fp32", 128), ("fp16", 64), ("sq8", 32), ("pq", 4)])
+def test_footprint_separates_codes_from_fixed_overhead(precision, code_size):
+    index = build_index(_vectors(), precision)
+    size, fixed = index_footprint(index)
+    assert size == code_size
+    if precision == "pq":
+        # 4 sub-quantizers x 256 centroids x 8 dims of float32 codebooks
+        assert fixed >= 4 * 256 * 8 * 4
+    # Doubling the catalog doubles the codes but not the fixed part
+    bigger = build_index(np.vstack([_vectors(), _vectors()]), precision)
+    assert index_footprint(bigger) == (size, fixed)
+
+
+def test_exact_rerank_recovers_exact_order():
+    vectors = _vectors()
+    exact = build_index(vectors, "fp32")
+    reranked = ExactRerankIndex(build_index(vectors, "sq8"), vectors)
+    _, exact_ids = exact.search(vectors[:5], 5)
+    _, ids = reranked.search(vectors[:5], 5)
+    np.testing.assert_array_equal(ids, exact_ids)
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from query_log import QueryLogMiddleware, QueryLogWriter
+
+
+class ListWriter:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+def _client(writer, sample):
+    app = FastAPI()
+    app.add_middleware(QueryLogMiddleware, writer=writer, sample=sample)
+
+    @app.post("/recommend")
+    def recommend(body: dict):
+        return {"results": []}
+
+    @app.get("/analytics")
+    def analytics():
+        return {}
+
+    return TestClient(app)
+
+
+def test_sampled_requests_are_captured_with_payload_and_status():
+    writer = ListWriter()
+    client = _client(writer, sample=1.0)
+    client.post("/recommend?debug=1", json={"query": "oak table", "top_k": 3})
+    client.get("/analytics")
+    # Only the replayable endpoints are captured
+    [record] = writer.records
+    assert record["endpoint"] == "/recommend"
+    assert record["method"] == "POST"
+    assert record["query_string"] == "debug=1"
+    assert record["body"] == {"query": "oak table", "top_k": 3}
+    assert record["status"] == 200
+    assert record["latency_ms"] >= 0
+
+
+def test_unsampled_requests_are_not_captured():
+    writer = ListWriter()
+    _client(writer, sample=0.0).post("/recommend", json={"query": "oak table"})
+    assert writer.records == []
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_writer_rotates_by_size_and_keeps_a_bounded_number_of_backups(tmp_path):
+    writer = QueryLogWriter(str(tmp_path / "queries.ndjson"), max_bytes=200, backups=2)
+    for i in range(40):
+        writer.write({"i": i, "pad": "x" * 50})
+        # Let the writer drain so each record is flushed and checked against the size limit
+        _wait_for(lambda: writer.stats["written"] == i + 1)
+    path = str(tmp_path / f"queries-{os.getpid()}.ndjson")
+    _wait_for(lambda: os.path.exists(path + ".2"))
+    assert not os.path.exists(path + ".3")
+    for name in (path + ".2", path + ".1"):
+        assert os.path.getsize(name) >= 200
+        with open(name) as f:
+            assert all("pad" in json.loads(line) for line in f)
+    assert writer.stats["dropped"] == 0
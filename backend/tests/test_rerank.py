@@ -0,0 +1,73 @@
+import time
+
+import pandas as pd
+
+import rerank
+from pagination import Candidates
+from rerank import Reranker, parse_price_cap
+
+
+def _reranker():
+    df = pd.DataFrame({
+        "uniq_id": ["a", "b", "c", "d"],
+        "brand": ["Acme", "Oakly", "Acme", None],
+        "categories": ["Chairs", "Tables", "Chairs", "Lamps"],
+        "price": [300.0, 150.0, 90.0, None],
+        "text": ["acme chair", "oakly table", "acme stool", "lamp"],
+    })
+    return Reranker(df, ["a", "b", "c", "d"], higher_is_better=True)
+
+
+def _candidates():
+    # FAISS order: a, b, c, d
+    return Candidates(None, [0, 1, 2, 3], [0.9, 0.8, 0.7, 0.6], exhausted=True)
+
+
+def test_parse_price_cap():
+    assert parse_price_cap("oak table under $200") == 200.0
+    assert parse_price_cap("chairs less than 99.5") == 99.5
+    assert parse_price_cap("oak table") is None
+
+
+def test_brand_and_price_features_reorder_candidates():
+    reranker = _reranker()
+    candidates = _candidates()
+    assert reranker.rerank("oakly tables under $200", candidates)
+    # b matches brand, category and price cap
+    assert candidates.indices[0] == 1
+    assert sorted(candidates.indices) == [0, 1, 2, 3]
+    # Distances move with their indices
+    assert candidates.distances[0] == 0.8
+    assert reranker.stats["reranked"] == 1
+
+
+def test_skips_when_the_estimated_cost_is_over_budget():
+    reranker = _reranker()
+    reranker._cost_per_item = 1.0
+    candidates = _candidates()
+    assert not reranker.rerank("oakly tables", candidates)
+    assert candidates.indices == [0, 1, 2, 3]
+    assert reranker.stats["skipped"] == 1
+    # The estimate decays so re-ranking is retried later
+    assert reranker._cost_per_item < 1.0
+
+    assert not reranker.rerank("anything", Candidates(None, [0], [0.9], exhausted=True))
+
+
+def test_gives_up_when_the_cross_encoder_spends_the_budget(monkeypatch):
+    monkeypatch.setattr(rerank, "RERANK_BUDGET_MS", 5)
+    monkeypatch.setattr(rerank, "RERANK_BATCH_SIZE", 1)
+
+    class SlowCrossEncoder:
+        def predict(self, pairs, batch_size):
+            time.sleep(0.01)
+            return [0.0] * len(pairs)
+
+    reranker = _reranker()
+    reranker.cross_encoder = SlowCrossEncoder()
+    candidates = _candidates()
+    assert not reranker.rerank("oakly tables", candidates)
+    # FAISS order is kept, and the measured cost feeds the next estimate
+    assert candidates.indices == [0, 1, 2, 3]
+    assert reranker.stats["skipped"] == 1
+    assert reranker._cost_per_item > 0
@@ -0,0 +1,41 @@
+import pytest
+
+from sessions import InMemorySessionStore, SessionStore, recency_weights
+
+
+def test_history_keeps_most_recent_unique_products():
+    store = InMemorySessionStore(max_entries=10, ttl=60, history=3)
+    store.append("s", ["a", "b"])
+    # Re-viewing "a" moves it to the newest slot; the oldest falls off
+    assert store.append("s", ["c", "a", "d"]) == ["c", "a", "d"]
+    assert store.get("s") == ["c", "a", "d"]
+    assert store.get("unknown") == []
+
+
+def test_idle_sessions_expire_and_the_store_is_bounded():
+    store = InMemorySessionStore(max_entries=2, ttl=-1, history=5)
+    store.append("s", ["a"])
+    assert store.get("s") == []
+
+    store = InMemorySessionStore(max_entries=2, ttl=60, history=5)
+    for session in ("s1", "s2", "s3"):
+        store.append(session, ["a"])
+    assert len(store) == 2
+    assert store.get("s1") == []
+    store.trim(0.5)
+    assert len(store) == 1
+    assert store.get("s3") == ["a"]
+
+
+def test_recency_weights_favour_newest():
+    assert recency_weights(3, decay=0.5) == pytest.approx([0.25, 0.5, 1.0])
+    assert recency_weights(2, decay=1.0) == [1.0, 1.0]
+
+
+def test_session_backends_must_implement_the_interface():
+    class Partial(SessionStore):
+        def get(self, session_id):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
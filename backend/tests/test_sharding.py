@@ -0,0 +1,143 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import Future
+
+import faiss
+import numpy as np
+import pytest
+
+from pagination import ensure_depth, search_candidates
+from sharding import ShardedIndex, ShardUnavailableError, authkey_for, build_shards
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def shards(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    shard_dir = str(tmp_path_factory.mktemp("shards"))
+    build_shards(vectors, 3, shard_dir)
+    return vectors, shard_dir
+
+
+def _exact(vectors, query, k):
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+    return flat.search(query, k)
+
+
+def test_scatter_gather_matches_a_single_index(shards):
+    vectors, shard_dir = shards
+    index = ShardedIndex(shard_dir, timeout_ms=5000, address="")
+    try:
+        index.start()
+        D, I = index.search(vectors[:4], 10)
+        D_exact, I_exact = _exact(vectors, vectors[:4], 10)
+        np.testing.assert_array_equal(I, I_exact)
+        np.testing.assert_allclose(D, D_exact, rtol=1e-5)
+        np.testing.assert_allclose(index.reconstruct(123), vectors[123], rtol=1e-6)
+    finally:
+        index.close()
+
+
+def test_degraded_answers_are_neither_exhausted_nor_spliced(shards):
+    vectors, shard_dir = shards
+    index = ShardedIndex(shard_dir, timeout_ms=5000, address="")
+    try:
+        index.start()
+        complete = search_candidates(index, vectors[0], 5)
+        assert not complete.degraded
+
+        # Shard 2 stops answering
+        send = index._send
+        index._send = lambda shard_id, op, payload: (-1, Future()) if shard_id == 2 else send(shard_id, op, payload)
+        index.timeout = 0.2
+        partial = search_candidates(index, vectors[0], 5)
+        assert partial.degraded
+        assert not partial.exhausted
+        assert index.stats["degraded"] >= 1
+
+        ensure_depth(index, complete, 50)
+        # The complete list keeps its hits rather than taking a partial extension
+        assert len(complete.indices) == 5
+        assert not complete.exhausted
+    finally:
+        index.close()
+
+
+def test_deepening_stops_when_every_shard_times_out(shards):
+    vectors, shard_dir = shards
+    index = ShardedIndex(shard_dir, timeout_ms=5000, address="")
+    try:
+        index.start()
+        # No shard answers
+        index._send = lambda shard_id, op, payload: (-1, Future())
+        index.timeout = 0.05
+        searches = []
+        search = index.search_with_status
+        index.search_with_status = lambda x, k: searches.append(k) or search(x, k)
+
+        candidates = search_candidates(index, vectors[0], 5)
+        assert candidates.degraded and candidates.indices == []
+        ensure_depth(index, candidates, 50)
+        # One extension attempt, then the short page is served (with a cursor, since it isn't exhausted)
+        assert len(searches) == 2
+        assert candidates.indices == []
+        assert not candidates.exhausted
+    finally:
+        index.close()
+
+
+def test_reconstruct_from_a_silent_shard_raises_shard_unavailable(shards):
+    vectors, shard_dir = shards
+    index = ShardedIndex(shard_dir, timeout_ms=5000, address="")
+    try:
+        index.start()
+        index._send = lambda shard_id, op, payload: (-1, Future())
+        index.timeout = 0.05
+        with pytest.raises(ShardUnavailableError):
+            index.reconstruct(5)
+        with pytest.raises(ShardUnavailableError):
+            index.reconstruct_batch([5, 250])
+    finally:
+        index.close()
+
+
+def test_workers_share_one_shard_server(shards, tmp_path):
+    vectors, shard_dir = shards
+    address = str(tmp_path / "shards.sock")
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "shard_server.py"), "--shard-dir", shard_dir, "--address", address]
+    )
+    clients = [ShardedIndex(shard_dir, timeout_ms=5000, address=address) for _ in range(2)]
+    try:
+        D_exact, I_exact = _exact(vectors, vectors[7:8], 5)
+        for index in clients:
+            index.start(timeout=60)
+            D, I = index.search(vectors[7:8], 5)
+            np.testing.assert_array_equal(I, I_exact)
+    finally:
+        for index in clients:
+            index.close()
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def test_tcp_shard_servers_require_an_explicit_authkey(shards):
+    _, shard_dir = shards
+    with pytest.raises(RuntimeError, match="SHARD_AUTHKEY"):
+        authkey_for("127.0.0.1:7000", "")
+    assert authkey_for("127.0.0.1:7000", "secret") == b"secret"
+    assert authkey_for("/tmp/shards.sock", "")
+
+    env = {k: v for k, v in os.environ.items() if k != "SHARD_AUTHKEY"}
+    server = subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "shard_server.py"), "--shard-dir", shard_dir,
+         "--address", "127.0.0.1:0"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert server.returncode != 0
+    assert "SHARD_AUTHKEY" in server.stderr
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    # Followers are parked on the leader's future before it finishes
+    while flight.snapshot()["collapsed"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader] + followers:
+        t.join()
+
+    assert results == ["result"] * 4
+    assert len(runs) == 1
+    assert flight.snapshot() == {"calls": 4, "executions": 1, "collapsed": 3, "inflight": 0}
+
+
+def test_errors_propagate_and_nothing_is_cached():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    # The next call runs again rather than replaying the failure
+    assert flight.do("k", lambda: 42) == 42
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from suggest import SuggestIndex, parse_categories
+
+
+def _index(titles, brands=None, categories=None):
+    df = pd.DataFrame({"title": titles})
+    if brands is not None:
+        df["brand"] = brands
+    if categories is not None:
+        df["categories"] = categories
+    return SuggestIndex(df, limit=5)
+
+
+def test_best_completion_survives_long_prefix_ranges():
+    # Thousands of keys sort before the bestseller under "cha", "chai", "chair "
+    titles = [f"chair model {i:05d}" for i in range(3000)] + ["chair zzz bestseller"] * 50
+    index = _index(titles)
+    for prefix in ("c", "cha", "chair", "chair ", "chair z"):
+        assert index.suggest(prefix)[0]["text"] == "chair zzz bestseller", prefix
+
+
+def test_ranked_by_weighted_count_then_alphabetically():
+    index = _index(
+        ["Oak Table", "Oak Table", "oak shelf", "oak bench"],
+        brands=["Oakworks", None, None, None],
+        categories=["['Oak Furniture']", None, None, None],
+    )
+    texts = [s["text"] for s in index.suggest("OAK", limit=10)]
+    # Category (x3) and brand (x2) weights beat a single title; equal scores sort by key
+    assert texts == ["Oak Furniture", "Oak Table", "Oakworks", "oak bench", "oak shelf"]
+    assert index.suggest("oak", limit=2) == index.suggest("oak")[:2]
+    assert index.suggest("walnut") == []
+    assert index.suggest("   ") == []
+
+
+def test_parse_categories_accepts_python_lists_and_loose_strings():
+    assert parse_categories("['Home', 'Furniture']") == ["Home", "Furniture"]
+    assert parse_categories("[Home, Furniture") == ["Home", "Furniture"]
+    assert parse_categories(None) == []
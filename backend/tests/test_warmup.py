@@ -0,0 +1,77 @@
+import json
+import time
+
+import pytest
+
+import warmup
+from warmup import DEFAULT_WARMUP_QUERIES, Readiness, load_top_queries
+
+
+def _wait_ready(readiness, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not readiness.ready:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def warmup_enabled(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", True)
+
+
+def test_ready_once_every_step_has_run_even_if_one_fails():
+    ran = []
+
+    def fail():
+        raise RuntimeError("model missing")
+
+    readiness = Readiness()
+    assert not readiness.ready
+    readiness.start([
+        ("encode", lambda: ran.append("encode")),
+        ("generate", fail),
+        ("search", lambda: ran.append("search")),
+    ])
+    _wait_ready(readiness)
+    assert ran == ["encode", "search"]
+    snapshot = readiness.snapshot()
+    assert snapshot["ready"] and snapshot["warmup_seconds"] is not None
+    assert snapshot["steps"]["generate"]["error"] == "model missing"
+    assert "error" not in snapshot["steps"]["encode"]
+
+    # Warm-up runs once per process
+    readiness.start([("encode", lambda: ran.append("again"))])
+    assert readiness.ready and ran == ["encode", "search"]
+
+
+def test_disabled_warmup_is_ready_immediately(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", False)
+    readiness = Readiness()
+    readiness.start([("encode", lambda: pytest.fail("should not run"))])
+    assert readiness.ready
+
+
+def test_top_queries_from_text_and_query_logs(tmp_path):
+    text = tmp_path / "queries.txt"
+    text.write_text("oak table\nlamp\n\noak table\n")
+    assert load_top_queries(str(text)) == ["oak table", "lamp"]
+
+    log = tmp_path / "queries.ndjson"
+    records = [
+        {"endpoint": "/recommend", "body": {"query": "lamp"}},
+        {"endpoint": "/recommend", "body": {"query": "sofa"}},
+        {"endpoint": "/recommend", "body": {"query": "sofa"}},
+        {"endpoint": "/recommend-by-id", "body": {"product_id": "p1"}},
+        {"endpoint": "/suggest", "body": None},
+    ]
+    log.write_text("\n".join(json.dumps(r) for r in records) + "\n{not json\n")
+    assert load_top_queries(str(log)) == ["sofa", "lamp"]
+    assert load_top_queries(str(log), limit=1) == ["sofa"]
+
+
+def test_top_queries_fall_back_to_the_defaults(tmp_path):
+    assert load_top_queries("") == DEFAULT_WARMUP_QUERIES
+    assert load_top_queries(str(tmp_path / "missing.txt"), limit=2) == DEFAULT_WARMUP_QUERIES[:2]
+    empty = tmp_path / "empty.txt"
+    empty.write_text("\n")
+    assert load_top_queries(str(empty)) == DEFAULT_WARMUP_QUERIES
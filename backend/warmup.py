@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+
+# Set WARMUP=0 to skip warm-up and report ready straight away
+WARMUP_ENABLED = os.environ.get("WARMUP", "1") == "1"
+# Optional top-query list: plain text (one query per line) or captured query logs (NDJSON)
+WARMUP_QUERIES_PATH = os.environ.get("WARMUP_QUERIES_PATH", "")
+WARMUP_MAX_QUERIES = int(os.environ.get("WARMUP_MAX_QUERIES", 200))
+# flan-t5 warm-up is the slowest step; WARMUP_GENERATE=0 skips it
+WARMUP_GENERATE = os.environ.get("WARMUP_GENERATE", "1") == "1"
+
+# Used when no top-query list is configured
+DEFAULT_WARMUP_QUERIES = ["modern sofa", "wooden dining table", "black office chair", "storage shelf"]
+
+
+def load_top_queries(path=WARMUP_QUERIES_PATH, limit=WARMUP_MAX_QUERIES):
+    """Most frequent search queries from a text file or query-log files, most frequent first"""
+    if not path or not os.path.exists(path):
+        return DEFAULT_WARMUP_QUERIES[:limit]
+    counts = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    body = json.loads(line).get("body") or {}
+                except ValueError:
+                    continue
+                query = body.get("query") if isinstance(body, dict) else None
+            else:
+                query = line
+            if query:
+                counts[query] += 1
+    return [q for q, _ in counts.most_common(limit)] or DEFAULT_WARMUP_QUERIES[:limit]
+
+
+class Readiness:
+    """Warm-up progress for one worker process; ready flips once every step has run"""
+
+    def __init__(self):
+        self.ready = not WARMUP_ENABLED
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self, steps):
+        """Run (name, fn) warm-up steps in a background thread, once per process"""
+        with self._lock:
+            if self._pid == os.getpid() or not WARMUP_ENABLED:
+                return
+            # A forked worker inherits the master's state; each process warms itself
+            self._pid = os.getpid()
+            self.ready = False
+        threading.Thread(target=self._run, args=(steps,), daemon=True).start()
+
+    def _run(self, steps):
+        self.started_at = time.time()
+        for name, fn in steps:
+            start = time.perf_counter()
+            try:
+                fn()
+                self.steps[name] = {"ms": round((time.perf_counter() - start) * 1000, 1)}
+            except Exception as e:
+                # A failed step leaves that path cold but shouldn't keep the worker out of rotation
+                traceback.print_exc()
+                self.steps[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+            print(f"Warm-up {name}: {self.steps[name]}")
+        self.finished_at = time.time()
+        self.ready = True
+        print(f"Worker {os.getpid()} warm in {self.finished_at - self.started_at:.1f}s")
+
+    def snapshot(self):
+        return {
+            "ready": self.ready,
+            "pid": os.getpid(),
+            "warmup_enabled": WARMUP_ENABLED,
+            "warmup_seconds": round(self.finished_at - self.started_at, 2) if self.finished_at else None,
+            "steps": dict(self.steps),
+        }